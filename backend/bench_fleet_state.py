@@ -0,0 +1,137 @@
+# --- /status Benchmark ---
+# Compares building the /status response the old way (nested dicts built from reading
+# rows on every request) with rendering it from FleetStateStore, at fleet scale.
+#
+#     python bench_fleet_state.py                 # 100k sensors, 4 per property
+#     python bench_fleet_state.py --sensors 20000
+#
+# No database or server needed: both sides are fed the same synthetic readings.
+import argparse
+import json
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from fleet_state import FleetStateStore
+from shared_state import InMemoryState
+
+SENSOR_TYPES = ["environmental", "plumbing", "boiler", "communal"]
+RISKS = ["Low"] * 8 + ["Medium", "High"]
+
+
+def make_fleet(sensors: int, per_property: int):
+    properties = [
+        {"property_id": pid, "address": f"{pid} High Street", "tenant_name": f"Tenant {pid}"}
+        for pid in range(1, sensors // per_property + 1)
+    ]
+    now = datetime(2026, 1, 1)
+    rows = []
+    for i in range(sensors):
+        rows.append(SimpleNamespace(
+            sensor_id=f"S-{i}",
+            property_id=i // per_property + 1,
+            sensor_type=SENSOR_TYPES[i % 4],
+            payload=json.dumps({"temp": round(random.uniform(15, 25), 2), "humidity": round(random.uniform(40, 90), 2)}),
+            risk_level=random.choice(RISKS),
+            timestamp=now + timedelta(seconds=i),
+            sequence=1,
+        ))
+    return properties, rows
+
+
+def legacy_status(properties, rows) -> str:
+    """The per-request approach /status used before the store (minus the DB query)."""
+    properties_dict = {
+        p["property_id"]: {**p, "risk_level": "Low", "sensors": {}} for p in properties
+    }
+    highest_risk = "Low"
+    for r in rows:
+        prop_id = r.property_id if r.property_id in properties_dict else 0
+        prop_sensors = properties_dict[prop_id]["sensors"]
+        if r.sensor_id not in prop_sensors:
+            prop_sensors[r.sensor_id] = {
+                "sensor_id": r.sensor_id,
+                "payload": json.loads(r.payload) if r.payload else {},
+                "timestamp": r.timestamp.isoformat(),
+                "risk_level": r.risk_level,
+                "type": r.sensor_type,
+            }
+            if r.risk_level == "High":
+                highest_risk = "High"
+                properties_dict[prop_id]["risk_level"] = "High"
+            elif r.risk_level == "Medium":
+                if highest_risk != "High": highest_risk = "Medium"
+                if properties_dict[prop_id]["risk_level"] != "High": properties_dict[prop_id]["risk_level"] = "Medium"
+    properties_list = list(properties_dict.values())
+    for p in properties_list:
+        p["sensors"] = list(p["sensors"].values())
+    return json.dumps({"status": "Online", "properties": properties_list, "risk_level": highest_risk})
+
+
+def measure(fn, repeat: int):
+    """(best wall time in ms, peak bytes allocated during one call)"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best * 1000, peak
+
+
+def retained(build):
+    """Bytes still allocated after build() returns (its result is kept alive)."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sensors", type=int, default=100000)
+    parser.add_argument("--per-property", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    properties, rows = make_fleet(args.sensors, args.per_property)
+    records = [
+        {"sensor_id": r.sensor_id, "property_id": r.property_id, "type": r.sensor_type,
+         "payload": json.loads(r.payload), "risk_level": r.risk_level,
+         "timestamp": r.timestamp.isoformat(), "sequence": r.sequence}
+        for r in rows
+    ]
+
+    # Live state held as one dict per sensor vs the compact store
+    _, dict_bytes = retained(lambda: {r["sensor_id"]: dict(r, payload=dict(r["payload"])) for r in records})
+
+    def build_store():
+        store = FleetStateStore(InMemoryState(), "sensor-updates")
+        for record in records:
+            store.update(record)
+        return store
+    store, store_bytes = retained(build_store)
+
+    legacy_ms, legacy_peak = measure(lambda: legacy_status(properties, rows), args.repeat)
+    store_ms, store_peak = measure(lambda: store.render_status(properties), args.repeat)
+    assert json.loads(store.render_status(properties))["risk_level"] == json.loads(legacy_status(properties, rows))["risk_level"]
+
+    start = time.perf_counter()
+    for record in records[:10000]:
+        store.update(record)
+    update_us = (time.perf_counter() - start) / 10000 * 1e6
+
+    mb = 1024 * 1024
+    print(f"{args.sensors} sensors across {len(properties)} properties")
+    print(f"{'':28}{'dict per request':>18}{'fleet store':>14}")
+    print(f"{'live state held (MB)':28}{dict_bytes / mb:>18.1f}{store_bytes / mb:>14.1f}")
+    print(f"{'/status build time (ms)':28}{legacy_ms:>18.1f}{store_ms:>14.1f}")
+    print(f"{'/status peak alloc (MB)':28}{legacy_peak / mb:>18.1f}{store_peak / mb:>14.1f}")
+    print(f"store update: {update_us:.1f} us/reading")
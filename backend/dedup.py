@@ -0,0 +1,52 @@
+import threading
+from collections import OrderedDict
+
+# --- Duplicate Detection ---
+# IoT Hub and the simulator can deliver the same reading more than once. Readings that
+# carry an idempotency key (or a per-sensor sequence number) are checked against a
+# bounded LRU of recently seen keys first, so the common case never costs a query.
+# The unique index on sensor_readings.dedup_key catches whatever falls out of the LRU
+# or arrives at a different worker.
+
+
+def dedup_key(sensor_id: str, idempotency_key: str | None, sequence: int | None,
+              epoch: int | None = None) -> str | None:
+    """
+    Key used to recognise a repeat delivery, or None if the reading can't be deduplicated.
+    The epoch scopes the sequence, so a device whose counter restarts (reboot, firmware
+    update) after bumping its epoch isn't mistaken for replaying old readings.
+    """
+    if idempotency_key:
+        return idempotency_key
+    if sequence is not None:
+        return f"{sensor_id}#{epoch}#{sequence}" if epoch is not None else f"{sensor_id}#{sequence}"
+    return None
+
+
+class RecentKeys:
+    """
+    Thread-safe LRU set with a fixed capacity.
+    """
+
+    def __init__(self, capacity: int = 100000):
+        self._capacity = capacity
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def seen(self, key: str) -> bool:
+        """True if the key is already known. Refreshes its position if so."""
+        with self._lock:
+            if key in self._keys:
+                self._keys.move_to_end(key)
+                return True
+            return False
+
+    def add(self, key: str):
+        with self._lock:
+            self._keys[key] = None
+            self._keys.move_to_end(key)
+            if len(self._keys) > self._capacity:
+                self._keys.popitem(last=False)
+
+    def __len__(self):
+        return len(self._keys)
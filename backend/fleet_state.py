@@ -0,0 +1,227 @@
+import json
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+# --- Fleet State Store ---
+# Long-lived, in-process copy of the latest reading per sensor, used to answer /status
+# without rebuilding nested dicts from DB rows on every request.
+#
+# Per sensor we keep one row in a NumPy structured array (property index, sensor type,
+# risk code, epoch, sequence, reading time) plus the sensor's JSON fragment for the response, pre-encoded
+# when the reading arrives. Rendering /status is then a sort by property and a string
+# join. Updates arrive through the shared state "sensor-updates" channel, so readings
+# ingested by other workers show up here too. The database is also polled every few
+# seconds for rows added since the last poll, which covers writers that can't reach
+# our channel (e.g. iot_consumer.py running with SHARED_STATE_URL=memory://).
+
+RISK_LEVELS = ("Low", "Medium", "High")
+RISK_CODES = {level: code for code, level in enumerate(RISK_LEVELS)}
+NO_SEQUENCE = -1
+
+RECORD_DTYPE = np.dtype([
+    ("property", np.int32),  # Interned property id
+    ("type", np.uint8),  # Interned sensor type
+    ("risk", np.uint8),
+    ("epoch", np.int64),  # Device boot/epoch, 0 if not sent
+    ("sequence", np.int64),
+    ("time", np.float64),  # Reading timestamp, NaN if not known
+])
+
+UNASSIGNED = {"property_id": 0, "address": "Unassigned Sensors", "tenant_name": "N/A"}
+
+
+class Interner:
+    """Maps repeated values (property ids, sensor types) to small dense ints."""
+    __slots__ = ("codes", "values")
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def code(self, value) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class FleetStateStore:
+    def __init__(self, shared_state, channel: str, loader=None, poll_interval: float = 5.0,
+                 capacity: int = 1024):
+        """
+        loader(after_id) returns (records, last_id): the latest record per sensor
+        (same shape as the ones published on `channel`) among stored readings with
+        id > after_id, and the highest id it looked at. It fills the store on first
+        use and is polled again every `poll_interval` seconds.
+        """
+        self._shared_state = shared_state
+        self._channel = channel
+        self._loader = loader
+        self._poll_interval = poll_interval
+        self._watermark = 0  # Highest reading id seen by the loader
+        self._next_poll = 0.0
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._records = np.zeros(capacity, RECORD_DTYPE)
+        self._fragments = [None] * capacity  # Pre-encoded sensor JSON, same slot as _records
+        self._slots = {}  # sensor_id -> slot
+        self._properties = Interner()
+        self._sensor_types = Interner()
+        self._last_event = None  # None until first sync()
+
+    def __len__(self):
+        return len(self._slots)
+
+    def update(self, record: dict, only_newer: bool = False) -> bool:
+        """
+        Applies one latest-state record. Ignores it if it's older (by epoch, then
+        sequence, or by timestamp when either side has no sequence) than what we
+        already hold for the sensor. With only_newer, a record for the same reading
+        is ignored too; DB rows carry no trend_risk, so they mustn't replace the
+        channel's copy of the reading.
+        """
+        sensor_id = record["sensor_id"]
+        sequence = record.get("sequence")
+        sequence = NO_SEQUENCE if sequence is None else sequence
+        epoch = record.get("epoch") or 0
+        timestamp = record.get("timestamp")
+        ts = datetime.fromisoformat(timestamp).timestamp() if timestamp else np.nan
+        with self._lock:
+            slot = self._slots.get(sensor_id)
+            if slot is None:
+                slot = len(self._slots)
+                if slot == len(self._records):
+                    self._grow()
+                self._slots[sensor_id] = slot
+            else:
+                held = self._records[slot]
+                if sequence != NO_SEQUENCE and held["sequence"] != NO_SEQUENCE:
+                    key, held_key = (epoch, sequence), (held["epoch"], held["sequence"])
+                    if key < held_key or (only_newer and key == held_key):
+                        return False
+                elif ts < held["time"] or (only_newer and ts == held["time"]):  # False if either is NaN
+                    return False
+
+            risk = record.get("risk_level") or "Low"
+            trend = record.get("trend_risk") or "Low"
+            self._records[slot] = (
+                self._properties.code(record.get("property_id")),
+                self._sensor_types.code(record.get("type")),
+                RISK_CODES.get(risk, 0),
+                epoch,
+                sequence,
+                ts,
+            )
+            self._fragments[slot] = json.dumps({
+                "sensor_id": sensor_id,
+                "payload": record.get("payload") or {},
+                "timestamp": record.get("timestamp"),
+                "risk_level": risk,
+                "trend_risk": trend,
+                "type": record.get("type"),
+            }, default=str)
+        return True
+
+    def _grow(self):
+        grown = np.zeros(len(self._records) * 2, RECORD_DTYPE)
+        grown[:len(self._records)] = self._records
+        self._records = grown
+        self._fragments.extend([None] * (len(grown) - len(self._fragments)))
+
+    def sync(self):
+        """
+        Applies updates published since the last call. Falls back to a full reload
+        if we're so far behind that the channel may have dropped events.
+        """
+        with self._sync_lock:
+            self._sync()
+
+    def _poll_loader(self):
+        self._next_poll = time.monotonic() + self._poll_interval
+        records, self._watermark = self._loader(self._watermark)
+        for record in records:
+            self.update(record, only_newer=True)
+
+    def _sync(self):
+        if self._last_event is None:
+            self._last_event = self._shared_state.last_event_id(self._channel)
+            if self._loader:
+                self._poll_loader()
+            for record in self._shared_state.all_latest().values():
+                self.update(record)
+            return
+
+        # Database first: the channel can only hold newer updates than what it returns
+        if self._loader and time.monotonic() >= self._next_poll:
+            self._poll_loader()
+
+        if self._shared_state.missed_events(self._channel, self._last_event):
+            self._last_event = self._shared_state.last_event_id(self._channel)
+            for record in self._shared_state.all_latest().values():
+                self.update(record)
+            return
+
+        while True:
+            events = self._shared_state.read_since(self._channel, self._last_event, limit=5000)
+            if not events:
+                return
+            for _, record in events:
+                self.update(record)
+            self._last_event = events[-1][0]
+
+    def render_status(self, properties: list[dict]) -> str:
+        """
+        JSON for /status. `properties` are dicts with property_id/address/tenant_name,
+        in the order they should be listed; sensors for unknown properties are listed
+        under a synthetic "Unassigned Sensors" property (id 0).
+        """
+        with self._lock:
+            n = len(self._slots)
+            records = self._records[:n].copy()
+            fragments = self._fragments[:n]
+            property_ids = list(self._properties.values)
+
+        # Group sensors by property: one sort, then slice boundaries
+        order = np.argsort(records["property"], kind="stable")
+        grouped = records["property"][order]
+        starts = np.flatnonzero(np.r_[True, grouped[1:] != grouped[:-1]]) if n else np.array([], dtype=int)
+        ends = np.r_[starts[1:], n]
+        risk = np.maximum.reduceat(records["risk"][order], starts) if n else []
+
+        groups = {}  # property_id -> (start, end, risk code)
+        unassigned = []
+        known = {p["property_id"] for p in properties}
+        for start, end, code in zip(starts.tolist(), ends.tolist(), np.asarray(risk).tolist()):
+            property_id = property_ids[grouped[start]]
+            if property_id in known:
+                groups[property_id] = (start, end, code)
+            else:
+                unassigned.append((start, end, code))
+
+        ordered = [fragments[i] for i in order.tolist()]
+        parts = []
+        highest = 0
+
+        def render(prop, slices):
+            nonlocal highest
+            code = max((c for _, _, c in slices), default=0)
+            highest = max(highest, code)
+            sensors = ",".join(",".join(ordered[start:end]) for start, end, _ in slices)
+            parts.append(
+                '{"property_id":%s,"address":%s,"tenant_name":%s,"risk_level":"%s","sensors":[%s]}' % (
+                    json.dumps(prop["property_id"]), json.dumps(prop["address"]),
+                    json.dumps(prop["tenant_name"]), RISK_LEVELS[code], sensors,
+                )
+            )
+
+        for prop in properties:
+            group = groups.get(prop["property_id"])
+            render(prop, [group] if group else [])
+        if unassigned:
+            render(UNASSIGNED, unassigned)
+
+        return '{"status":"Online","properties":[%s],"risk_level":"%s"}' % (",".join(parts), RISK_LEVELS[highest])
@@ -0,0 +1,17 @@
+import multiprocessing
+import os
+
+# Gunicorn config for multi-worker deployments:
+#   gunicorn -c gunicorn.conf.py main:app
+# Each worker is a separate process, so point SHARED_STATE_URL at a sqlite:/// or
+# redis:// backend, otherwise caches and live updates stay private to one worker.
+# Run `python main.py migrate` first and set AUTO_MIGRATE=false, so workers don't all
+# try to migrate the schema at once.
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "uvicorn.workers.UvicornWorker"
+keepalive = 5
+graceful_timeout = 30
+# SSE connections stay open, so don't let the arbiter kill quiet workers too early
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
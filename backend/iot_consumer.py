@@ -0,0 +1,156 @@
+# --- IoT Queue Consumer ---
+# Pulls device messages off a partitioned queue (see message_queue.py) and ingests them
+# in large batches: one DB commit per batch instead of one HTTP request per reading.
+# Messages are acked only after their batch is committed, so a crash means redelivery
+# (dropped again by the dedup keys), never data loss. A message that can't be ingested
+# at all goes to a dead-letter file instead of blocking its partition.
+#
+#     python iot_consumer.py                          # file://./queue, 4 partitions
+#     python iot_consumer.py --partitions 8 --batch-size 1000
+#
+# Produce into the same queue with `SIM_TRANSPORT=queue python sim.py`.
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from pydantic import ValidationError
+from sqlalchemy.exc import OperationalError
+
+from main import AUTO_MIGRATE, SensorData, ingest_batch, init_db
+from message_queue import MessageQueue, create_queue
+
+DEFAULT_BATCH_SIZE = 500
+RETRY_DELAY = 2.0  # Seconds to back off after a failed batch
+DEAD_LETTER_PATH = os.getenv("DEAD_LETTER_PATH", "dead-letter.jsonl")
+
+# Failures that say nothing about the messages themselves (database down or locked,
+# shared state unreachable). The batch is retried as a whole once things recover.
+TRANSIENT_ERRORS = (OperationalError, sqlite3.OperationalError, ConnectionError, TimeoutError)
+
+_dead_letter_lock = threading.Lock()
+
+
+def dead_letter(path: str, partition: int, msg, error: Exception):
+    """Sets aside a message that can never be ingested, with the reason, for inspection."""
+    line = json.dumps({"partition": partition, "offset": msg.offset, "error": repr(error),
+                       "body": msg.body}, default=str)
+    with _dead_letter_lock, open(path, "a") as f:
+        f.write(line + "\n")
+
+
+def _ingest_one_by_one(partition: int, batch: list, dead_letter_path: str) -> tuple[list[dict], int]:
+    """
+    Fallback after a batch failed: finds the reading(s) at fault and dead-letters them
+    so the rest of the batch still lands. Transient errors are re-raised.
+    """
+    results, failed = [], 0
+    for msg, data in batch:
+        try:
+            results.extend(ingest_batch([data]))
+        except TRANSIENT_ERRORS:
+            raise
+        except Exception as e:
+            print(f"[partition {partition}] Dead-lettering message at offset {msg.offset}: {e!r}")
+            dead_letter(dead_letter_path, partition, msg, e)
+            failed += 1
+    return results, failed
+
+
+def consume_partition(queue: MessageQueue, partition: int, stop: threading.Event,
+                      batch_size: int = DEFAULT_BATCH_SIZE, stats: dict | None = None,
+                      dead_letter_path: str = DEAD_LETTER_PATH):
+    """
+    Receive -> ingest -> ack loop for one partition. Runs until `stop` is set.
+    """
+    while not stop.is_set():
+        messages = queue.receive(partition, batch_size, timeout=1.0)
+        if not messages:
+            continue
+
+        batch, failed = [], 0  # batch: (message, SensorData)
+        for msg in messages:
+            error = msg.error  # Set by the queue if the message couldn't even be decoded
+            if error is None:
+                try:
+                    batch.append((msg, SensorData(**msg.body)))
+                    continue
+                except (TypeError, ValidationError) as e:
+                    error = e
+            # A malformed message will never succeed, so don't retry it
+            print(f"[partition {partition}] Dead-lettering invalid message at offset {msg.offset}: {error}")
+            dead_letter(dead_letter_path, partition, msg, error)
+            failed += 1
+
+        try:
+            try:
+                results = ingest_batch([data for _, data in batch]) if batch else []
+            except TRANSIENT_ERRORS:
+                raise
+            except Exception as e:
+                print(f"[partition {partition}] Batch of {len(batch)} failed, retrying one by one: {e!r}")
+                results, bad = _ingest_one_by_one(partition, batch, dead_letter_path)
+                failed += bad
+        except TRANSIENT_ERRORS as e:
+            print(f"[partition {partition}] Batch of {len(messages)} failed, will retry: {e}")
+            queue.release(partition, messages)
+            stop.wait(RETRY_DELAY)
+            continue
+
+        queue.ack(partition, messages)
+        if stats is not None:
+            with stats["lock"]:
+                stats["ingested"] += sum(1 for r in results if not r.get("duplicate"))
+                stats["duplicates"] += sum(1 for r in results if r.get("duplicate"))
+                stats["dead_lettered"] += failed
+
+
+def run_consumer(queue: MessageQueue, partitions: list[int] | None = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE, stop: threading.Event | None = None) -> dict:
+    """
+    Starts one thread per partition and blocks until `stop` is set (or Ctrl+C).
+    Returns counters of what was ingested.
+    """
+    partitions = partitions if partitions is not None else list(range(queue.partitions))
+    stop = stop or threading.Event()
+    stats = {"ingested": 0, "duplicates": 0, "dead_lettered": 0, "lock": threading.Lock()}
+    threads = [
+        threading.Thread(target=consume_partition, args=(queue, p, stop, batch_size, stats),
+                         name=f"consumer-{p}", daemon=True)
+        for p in partitions
+    ]
+    for t in threads:
+        t.start()
+    try:
+        while any(t.is_alive() for t in threads) and not stop.is_set():
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    stop.set()
+    for t in threads:
+        t.join()
+    return {key: stats[key] for key in ("ingested", "duplicates", "dead_lettered")}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest device telemetry from a local queue.")
+    parser.add_argument("--queue", default=None, help="Queue URL (default: LOCAL_QUEUE_URL or file://./queue)")
+    parser.add_argument("--partitions", type=int, default=None, help="Total partitions in the queue")
+    parser.add_argument("--only", type=int, nargs="*", default=None,
+                        help="Consume just these partitions (to split them across processes)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    if AUTO_MIGRATE:
+        init_db()
+    if os.getenv("SHARED_STATE_URL", "memory://").startswith("memory://"):
+        print("Warning: SHARED_STATE_URL is memory://, so the API won't get live updates from this "
+              "process. /status still picks readings up from the DB every STATUS_DB_POLL_INTERVAL "
+              "seconds, but /status/stream won't show them.")
+    queue = create_queue(args.queue, args.partitions)
+    print(f"Consuming {queue.partitions} partitions. Press Ctrl+C to stop.")
+    totals = run_consumer(queue, args.only, args.batch_size)
+    print(f"Stopped. Ingested {totals['ingested']} readings, skipped {totals['duplicates']} duplicates, "
+          f"dead-lettered {totals['dead_lettered']} (see {DEAD_LETTER_PATH}).")
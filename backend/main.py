@@ -1,13 +1,26 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, FastAPI, HTTPException, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, Float, String, DateTime
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, Column, Integer, BigInteger, Float, String, DateTime, Boolean, Index, func, inspect, or_, text
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-import uvicorn
+import asyncio
+import json
 import os
+import sys
 from dotenv import load_dotenv
+from shared_state import create_shared_state
+from stream_analytics import TrendAnalyzer
+from dedup import RecentKeys, dedup_key
+from ticket_search import create_ticket_index
+from sla import SLA_BANDS, BAND_LABELS, OPEN_STATUSES, RESOLVED_STATUSES, band_for, sla_outcome, apply_sla
 
 # Load environment variables from .env file
 load_dotenv()
@@ -22,6 +35,15 @@ engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} i
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# --- Shared State ---
+# Cache entries, latest sensor state and live-update events live here so that every
+# worker process sees the same data (see shared_state.py for the backends).
+shared_state = create_shared_state()
+SENSOR_UPDATES_CHANNEL = "sensor-updates"
+PROPERTIES_CACHE_KEY = "properties"
+PROPERTIES_CACHE_TTL = 30  # seconds
+SLA_ALERTS_CHANNEL = "sla-alerts"
+
 # --- Models ---
 class SensorReading(Base):
     __tablename__ = "sensor_readings"
@@ -32,6 +54,15 @@ class SensorReading(Base):
     payload = Column(String)  # JSON stringified data
     risk_level = Column(String)  # "Low", "Medium", "High"
     timestamp = Column(DateTime, default=datetime.utcnow)
+    sequence = Column(Integer, nullable=True)  # Per-sensor counter sent by the device
+    epoch = Column(BigInteger, nullable=True)  # Device boot/epoch the sequence belongs to
+    dedup_key = Column(String, nullable=True)  # Idempotency key, or "<sensor_id>[#<epoch>]#<sequence>"
+
+    __table_args__ = (
+        # Backstop for duplicate deliveries. Filtered so SQL Server allows many NULLs.
+        Index("ix_sensor_readings_dedup_key", "dedup_key", unique=True,
+              mssql_where=text("dedup_key IS NOT NULL")),
+    )
 
 class User(Base):
     __tablename__ = "users"
@@ -61,10 +92,97 @@ class Ticket(Base):
     priority = Column(String, default="Medium") # Low, Medium, High, Emergency
     category = Column(String, default="General") # Damp, Boiler, Electrical, ASB, Other
     created_at = Column(DateTime, default=datetime.utcnow)
-    sla_due = Column(DateTime, nullable=True)
+    sla_due = Column(DateTime, nullable=True)  # Set from the priority's SLA band (sla.py)
+    resolved_at = Column(DateTime, nullable=True)
+    sla_met = Column(Boolean, nullable=True)  # Only set once resolved
+    sla_breached = Column(Boolean, nullable=True, default=False)
+    sla_alert = Column(String, nullable=True)  # Last SLA alert published: None, "due_soon", "breached"
+
+    __table_args__ = (
+        # The breach scanner only reads open tickets in one alert state due inside a time window
+        Index("ix_tickets_status_sla_alert_due", "status", "sla_alert", "sla_due"),
+    )
+
+class SlaStats(Base):
+    """
+    Running met/breached counts per SLA band, updated as tickets resolve so the
+    analytics never need to scan every ticket.
+    """
+    __tablename__ = "sla_stats"
+    band = Column(String, primary_key=True)  # "Emergency", "Urgent", "Routine"
+    met = Column(Integer, default=0)
+    breached = Column(Integer, default=0)
+
+class MouldRiskScore(Base):
+    __tablename__ = "property_mould_scores"
+    property_id = Column(Integer, primary_key=True)
+    score = Column(Float)  # Probability 0-1 from the batch model (mould_scoring.py)
+    risk_level = Column(String)  # "Low", "Medium", "High"
+    features = Column(String)  # JSON stringified model inputs, for explaining the score
+    readings_used = Column(Integer)
+    scored_at = Column(DateTime, default=datetime.utcnow)
+
+def add_missing_columns():
+    """
+    create_all() only creates missing tables. Add any new (nullable) columns and
+    indexes to tables that already exist, so older databases keep working.
+    """
+    insp = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not insp.has_table(table.name):
+            continue
+        existing = {c["name"] for c in insp.get_columns(table.name)}
+        missing = [c for c in table.columns if c.name not in existing]
+        if missing:
+            with engine.begin() as conn:
+                for col in missing:
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD {col.name} {col.type.compile(engine.dialect)}"))
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+def rebuild_sla_stats(db):
+    """
+    Recounts SlaStats from scratch. Only needed after seeding or on a database
+    that predates the table; normal updates go through record_sla_outcome().
+    """
+    counts = {band: [0, 0] for band in SLA_BANDS}
+    resolved = db.query(Ticket.priority, Ticket.sla_met).filter(
+        Ticket.status.in_(RESOLVED_STATUSES), Ticket.sla_met.isnot(None)
+    )
+    for priority, met in resolved:
+        counts[band_for(priority)][0 if met else 1] += 1
+    db.query(SlaStats).delete()
+    db.add_all(SlaStats(band=band, met=met, breached=breached) for band, (met, breached) in counts.items())
+    db.commit()
+
+def init_sla_stats():
+    db = SessionLocal()
+    if db.query(SlaStats).count() == 0:
+        rebuild_sla_stats(db)
+    db.close()
+
+# Production runs `python main.py migrate` before deploying and sets AUTO_MIGRATE=false
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "true").lower() in ("1", "true", "yes")
+
+def init_db():
+    """
+    Creates tables and applies column/index migrations. Run it explicitly with
+    `python main.py migrate`, or let the app do it on startup (AUTO_MIGRATE=true).
+    """
+    Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+    init_sla_stats()
+    get_ticket_index().migrate()
+
+# Full-text index over ticket title/description (see ticket_search.py). Its tables
+# come from init_db(); the in-process index loads on first search or warm-up.
+_ticket_index = None
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+def get_ticket_index():
+    global _ticket_index
+    if _ticket_index is None:
+        _ticket_index = create_ticket_index(engine, SessionLocal, Ticket, shared_state)
+    return _ticket_index
 
 # --- Pydantic Models (Data Validation) ---
 class SensorData(BaseModel):
@@ -72,6 +190,15 @@ class SensorData(BaseModel):
     sensor_id: str
     sensor_type: str
     payload: dict
+    # Optional, for safe retries: repeat deliveries with the same key/sequence are ignored
+    idempotency_key: str | None = None
+    sequence: int | None = None
+    # Goes up whenever the device's sequence counter restarts (e.g. its boot time).
+    # Sequences are only compared within an epoch, so a reboot doesn't look like a replay.
+    epoch: int | None = None
+    # When the device took the reading. Queued or replayed telemetry keeps its real
+    # spacing; without it the receive time is used. Naive values are server local time.
+    timestamp: datetime | None = None
 
 class StatusResponse(BaseModel):
     status: str
@@ -90,6 +217,14 @@ class PropertyResponse(BaseModel):
     class Config:
         orm_mode = True
 
+class MouldRiskResponse(BaseModel):
+    property_id: int
+    score: float
+    risk_level: str
+    features: dict
+    readings_used: int
+    scored_at: datetime
+
 class CreateTicket(BaseModel):
     user_id: int
     title: str
@@ -110,6 +245,8 @@ class TicketResponse(BaseModel):
     category: str
     created_at: datetime
     sla_due: datetime | None = None
+    resolved_at: datetime | None = None
+    sla_breached: bool | None = None
     
     # Enhanced Fields for UI
     tenant_name: str | None = None
@@ -119,6 +256,9 @@ class TicketResponse(BaseModel):
     class Config:
         orm_mode = True
 
+class TicketSearchResult(TicketResponse):
+    score: float
+
 class CreateUser(BaseModel):
     name: str
     email: str
@@ -133,15 +273,8 @@ class UserResponse(BaseModel):
         orm_mode = True
 
 # --- App & Logic ---
-app = FastAPI(title="PropSense AI API")
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"], # Allow all origins for dev to avoid any port mismatch issues
-    allow_credentials=False, # Must be False if allow_origins=["*"] to prevent browser CORS errors
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Endpoints are registered on a router; create_app() (bottom of file) builds the app.
+router = APIRouter()
 
 def calculate_risk(sensor_type: str, payload: dict) -> str:
     """
@@ -187,16 +320,145 @@ def calculate_risk(sensor_type: str, payload: dict) -> str:
     # Default fallback
     return "Low"
 
+# Windowed trend analysis that runs alongside calculate_risk on every reading.
+# Its per-sensor state lives in shared_state, so every worker sees the same history.
+trend_analyzer = TrendAnalyzer(shared_state)
+
+# Recently ingested dedup keys, checked before touching the DB
+recent_keys = RecentKeys(int(os.getenv("DEDUP_CACHE_SIZE", "100000")))
+
+# --- Ingestion ---
+# Shared by POST /sensor-data (one reading) and iot_consumer.py (large batches).
+
+MAX_CLOCK_SKEW = timedelta(minutes=5)  # Device clocks further ahead than this are ignored
+
+def _reading_time(sent_at: datetime | None, received_at: datetime) -> datetime:
+    """
+    Time to store a reading under (server local time, like the rest of the table).
+    """
+    if sent_at is None:
+        return received_at
+    if sent_at.tzinfo is not None:
+        sent_at = sent_at.astimezone().replace(tzinfo=None)
+    if sent_at > received_at + MAX_CLOCK_SKEW:
+        return received_at
+    return sent_at
+
+def _duplicate_result() -> dict:
+    return {"message": "Duplicate ignored", "duplicate": True}
+
+def _store_readings(rows: list[dict]) -> list[dict]:
+    """
+    Inserts the rows in a single commit and returns the ones that were stored.
+    If a dedup key is already in the table the batch is retried row by row so
+    only the real duplicates are dropped.
+    """
+    db = SessionLocal()
+    try:
+        db.add_all([SensorReading(**row) for row in rows])
+        db.commit()
+        return rows
+    except IntegrityError:
+        db.rollback()
+        if len(rows) == 1 and not rows[0]["dedup_key"]:
+            raise
+        stored = []
+        for row in rows:
+            db.add(SensorReading(**row))
+            try:
+                db.commit()
+                stored.append(row)
+            except IntegrityError:
+                # Seen by another worker, or too long ago to still be in our LRU
+                db.rollback()
+                if not row["dedup_key"]:
+                    raise
+        return stored
+    finally:
+        db.close()
+
+def ingest_batch(batch: list[SensorData]) -> list[dict]:
+    """
+    Scores and stores a batch of readings with one DB commit, then updates trend
+    analysis and the shared latest state. Returns one result per reading, in order.
+    """
+    results = [_duplicate_result() for _ in batch]
+    now = datetime.now()
+    rows, row_index, batch_keys = [], [], set()
+    for i, data in enumerate(batch):
+        key = dedup_key(data.sensor_id, data.idempotency_key, data.sequence, data.epoch)
+        if key and (key in batch_keys or recent_keys.seen(key)):
+            continue
+        if key:
+            batch_keys.add(key)
+        rows.append({
+            "property_id": data.property_id,
+            "sensor_id": data.sensor_id,
+            "sensor_type": data.sensor_type,
+            "payload": json.dumps(data.payload),
+            "risk_level": calculate_risk(data.sensor_type, data.payload),
+            "timestamp": _reading_time(data.timestamp, now),
+            "sequence": data.sequence,
+            "epoch": data.epoch,
+            "dedup_key": key,
+        })
+        row_index.append(i)
+
+    if not rows:
+        return results
+    stored = {id(row) for row in _store_readings(rows)}
+
+    for i, row in zip(row_index, rows):
+        if row["dedup_key"]:
+            recent_keys.add(row["dedup_key"])
+        if id(row) not in stored:
+            continue
+        data = batch[i]
+        trend = trend_analyzer.update(data.sensor_id, data.sensor_type, data.payload, row["timestamp"])
+
+        # Share the new state with every worker and push it to live subscribers
+        latest = {
+            "sensor_id": data.sensor_id,
+            "property_id": data.property_id,
+            "type": data.sensor_type,
+            "payload": data.payload,
+            "risk_level": row["risk_level"],
+            "trend_risk": trend["trend_risk"],
+            "timestamp": row["timestamp"].isoformat(),
+            "sequence": data.sequence,
+            "epoch": data.epoch,
+        }
+        # An out-of-order reading is still stored above, but must not replace newer state
+        if shared_state.set_latest(data.sensor_id, latest):
+            shared_state.publish(SENSOR_UPDATES_CHANNEL, latest)
+
+        results[i] = {
+            "message": "Data received",
+            "risk_evaluation": row["risk_level"],
+            "trend_risk": trend["trend_risk"],
+            "trend_metrics": trend["metrics"],
+        }
+    return results
+
 # --- Endpoints ---
 
-@app.get("/properties", response_model=list[PropertyResponse])
-def get_properties():
+def _load_properties() -> list[dict]:
+    cached = shared_state.cache_get(PROPERTIES_CACHE_KEY)
+    if cached is not None:
+        return cached
     db = SessionLocal()
     props = db.query(Property).all()
     db.close()
+    # Store plain dicts so any backend (including Redis/SQLite) can serialise them
+    props = [{c.name: getattr(p, c.name) for c in Property.__table__.columns} for p in props]
+    shared_state.cache_set(PROPERTIES_CACHE_KEY, props, ttl=PROPERTIES_CACHE_TTL)
     return props
 
-@app.get("/properties/{property_id}", response_model=PropertyResponse)
+@router.get("/properties", response_model=list[PropertyResponse])
+def get_properties():
+    return _load_properties()
+
+@router.get("/properties/{property_id}", response_model=PropertyResponse)
 def get_property(property_id: int):
     db = SessionLocal()
     prop = db.query(Property).filter(Property.id == property_id).first()
@@ -205,7 +467,26 @@ def get_property(property_id: int):
         raise HTTPException(status_code=404, detail="Property not found")
     return prop
 
-@app.get("/properties/{property_id}/sensors")
+@router.get("/properties/{property_id}/mould-risk", response_model=MouldRiskResponse)
+def get_property_mould_risk(property_id: int):
+    """
+    Latest predictive damp & mould score written by the batch job (mould_scoring.py).
+    """
+    db = SessionLocal()
+    score = db.query(MouldRiskScore).filter(MouldRiskScore.property_id == property_id).first()
+    db.close()
+    if not score:
+        raise HTTPException(status_code=404, detail="No mould risk score for this property yet")
+    return {
+        "property_id": score.property_id,
+        "score": score.score,
+        "risk_level": score.risk_level,
+        "features": json.loads(score.features) if score.features else {},
+        "readings_used": score.readings_used,
+        "scored_at": score.scored_at,
+    }
+
+@router.get("/properties/{property_id}/sensors")
 def get_property_sensors(property_id: int):
     """
     Returns 24h history of sensor data (Mocked for MVP, would query SensorReading in prod)
@@ -235,7 +516,7 @@ def get_property_sensors(property_id: int):
         })
     return data
 
-@app.get("/properties/{property_id}/timeline")
+@router.get("/properties/{property_id}/timeline")
 def get_property_timeline(property_id: int):
     """
     Returns combined feed of events (Mocked)
@@ -245,152 +526,263 @@ def get_property_timeline(property_id: int):
         {"type": "ticket", "message": "Tenant reported 'damp smell'", "timestamp": str(datetime.now())},
     ]
 
-@app.post("/sensor-data")
+@router.post("/sensor-data")
 def ingest_data(data: SensorData, background_tasks: BackgroundTasks):
     """
     Receives JSON data from the Simulator (or IoT Hub).
+    Repeat deliveries (same idempotency_key, or same sensor_id + epoch + sequence) are ignored.
+    """
+    return ingest_batch([data])[0]
+
+@router.get("/status/stream")
+async def stream_status(request: Request):
+    """
+    Server-Sent Events feed of sensor updates. Works across workers because events
+    are read from the shared state backend rather than from process memory.
+    Clients can resume with the standard Last-Event-ID header.
+    """
+    last_id = request.headers.get("last-event-id")
+    if last_id is not None and last_id.isdigit():
+        last_id = int(last_id)
+    else:
+        last_id = await asyncio.to_thread(shared_state.last_event_id, SENSOR_UPDATES_CHANNEL)
+
+    async def event_source():
+        nonlocal last_id
+        while not await request.is_disconnected():
+            events = await asyncio.to_thread(shared_state.read_since, SENSOR_UPDATES_CHANNEL, last_id)
+            for event_id, message in events:
+                last_id = event_id
+                yield f"id: {event_id}\ndata: {json.dumps(message)}\n\n"
+            if not events:
+                await asyncio.sleep(1)
+
+    return StreamingResponse(event_source(), media_type="text/event-stream")
+
+def _latest_readings_from_db(after_id: int = 0) -> tuple[list[dict], int]:
+    """
+    Latest stored reading per sensor among rows with id > after_id, plus the highest
+    id looked at. Fills the fleet state store, then keeps it in step with readings
+    other processes write to the DB.
     """
-    risk = calculate_risk(data.sensor_type, data.payload)
-    
-    import json
     db = SessionLocal()
-    reading = SensorReading(
-        property_id=data.property_id,
-        sensor_id=data.sensor_id,
-        sensor_type=data.sensor_type,
-        payload=json.dumps(data.payload), 
-        risk_level=risk,
-        timestamp=datetime.now()
+    last_id = db.query(func.max(SensorReading.id)).scalar() or 0
+    if last_id <= after_id:
+        db.close()
+        return [], after_id
+    newest = (
+        db.query(func.max(SensorReading.id))
+        .filter(SensorReading.id > after_id, SensorReading.id <= last_id)
+        .group_by(SensorReading.sensor_id)
     )
-    db.add(reading)
-    db.commit()
-    db.refresh(reading)
+    rows = db.query(SensorReading).filter(SensorReading.id.in_(newest)).yield_per(5000)
+    records = [
+        {
+            "sensor_id": r.sensor_id,
+            "property_id": r.property_id,
+            "type": r.sensor_type,
+            "payload": json.loads(r.payload) if r.payload else {},
+            "risk_level": r.risk_level,
+            "timestamp": r.timestamp.isoformat() if r.timestamp else None,
+            "sequence": r.sequence,
+            "epoch": r.epoch,
+        }
+        for r in rows
+    ]
     db.close()
-    
-    return {"message": "Data received", "risk_evaluation": risk}
+    return records, last_id
+
+# Latest state per sensor, kept up to date from the sensor-updates channel and a
+# periodic check for new rows in the DB. Created on first /status so NumPy isn't
+# imported unless it's needed.
+STATUS_DB_POLL_INTERVAL = float(os.getenv("STATUS_DB_POLL_INTERVAL", "5"))  # seconds
+_fleet_state = None
 
-@app.get("/status", response_model=StatusResponse)
+def get_fleet_state():
+    global _fleet_state
+    if _fleet_state is None:
+        from fleet_state import FleetStateStore
+        _fleet_state = FleetStateStore(shared_state, SENSOR_UPDATES_CHANNEL, _latest_readings_from_db,
+                                       STATUS_DB_POLL_INTERVAL)
+    return _fleet_state
+
+@router.get("/status", response_model=StatusResponse)
 def get_status():
     """
     Used by the Mobile App and Dashboard to see the latest state.
+    Served from the in-memory fleet state store and already JSON-encoded,
+    so no per-request DB scan or dict building.
+    """
+    fleet_state = get_fleet_state()
+    fleet_state.sync()
+    properties = [
+        {"property_id": p["id"], "address": p["address"], "tenant_name": p["tenant_name"]}
+        for p in _load_properties()
+    ]
+    return Response(content=fleet_state.render_status(properties), media_type="application/json")
+
+# --- SLA Tracking ---
+
+def record_sla_outcome(db, before: tuple[str, bool] | None, after: tuple[str, bool] | None):
+    """
+    Moves a ticket's contribution to SlaStats when it resolves, re-opens, changes
+    priority or is deleted. Runs in the caller's transaction.
+    """
+    if before == after:
+        return
+    for outcome, delta in ((before, -1), (after, 1)):
+        if outcome is None:
+            continue
+        band, met = outcome
+        column = SlaStats.met if met else SlaStats.breached
+        db.query(SlaStats).filter(SlaStats.band == band).update(
+            {column: column + delta}, synchronize_session=False
+        )
+
+def scan_sla_breaches(warning_window: timedelta = timedelta(hours=4)) -> dict:
+    """
+    Publishes a "breached" alert for open tickets past their SLA and a "due_soon"
+    warning for ones due within warning_window. The last alert sent is kept on the
+    ticket (sla_alert), so each deadline is alerted at most once however the ticket
+    got there: escalated or edited after its due time, imported, or simply late.
+
+    Every worker runs this scan, so each alert is claimed first with a conditional
+    UPDATE that only matches while the ticket is still in the state we read. Only
+    the worker whose claim committed publishes; if publishing then fails the alert
+    is lost rather than sent twice.
     """
+    now = datetime.utcnow()
     db = SessionLocal()
-    
-    props = db.query(Property).all()
-    # Mapping property_id to property data structure
-    properties_dict = {
-        p.id: {
-            "property_id": p.id,
-            "address": p.address,
-            "tenant_name": p.tenant_name,
-            "risk_level": "Low",
-            "sensors": {}
-        } for p in props
-    }
-    
-    highest_risk = "Low"
-    
-    # In SQLite, we can just do a groupby/max or simple queries.
-    # For simplicity MVP, let's just get the last 200 readings and find the latest per sensor_id.
-    recent_readings = db.query(SensorReading).order_by(SensorReading.timestamp.desc()).limit(200).all()
-    
-    import json
-    for r in recent_readings:
-        prop_id = r.property_id
-        # Assign to property, or "Unassigned" (id: 0)
-        if prop_id not in properties_dict:
-            if 0 not in properties_dict:
-                properties_dict[0] = {"property_id": 0, "address": "Unassigned Sensors", "tenant_name": "N/A", "risk_level": "Low", "sensors": {}}
-            prop_id = 0
-            
-        prop_sensors = properties_dict[prop_id]["sensors"]
-        if r.sensor_id not in prop_sensors:
-            prop_sensors[r.sensor_id] = {
-                "sensor_id": r.sensor_id,
-                "payload": json.loads(r.payload) if r.payload else {},
-                "timestamp": r.timestamp.isoformat(),
-                "risk_level": r.risk_level,
-                "type": r.sensor_type
-            }
-            if r.risk_level == "High":
-                highest_risk = "High"
-                properties_dict[prop_id]["risk_level"] = "High"
-            elif r.risk_level == "Medium":
-                if highest_risk != "High": highest_risk = "Medium"
-                if properties_dict[prop_id]["risk_level"] != "High": properties_dict[prop_id]["risk_level"] = "Medium"
+    open_tickets = db.query(Ticket.id, Ticket.sla_alert, Ticket.sla_due, Ticket.title, Ticket.priority).filter(
+        Ticket.status.in_(OPEN_STATUSES)
+    )
+    # One (status, sla_alert, sla_due) index range per alert state; breached tickets are never read
+    candidates = (
+        open_tickets.filter(Ticket.sla_alert.is_(None), Ticket.sla_due < now + warning_window).all()
+        + open_tickets.filter(Ticket.sla_alert == "due_soon", Ticket.sla_due < now).all()
+    )
+    db.commit()  # End the read transaction before claiming
 
+    counts = {"breached": 0, "due_soon": 0}
+    for ticket_id, alert, sla_due, title, priority in candidates:
+        new_alert = "breached" if sla_due < now else "due_soon"
+        values = {Ticket.sla_alert: new_alert}
+        if new_alert == "breached":
+            values[Ticket.sla_breached] = True
+        claimed = db.query(Ticket).filter(
+            Ticket.id == ticket_id,
+            Ticket.status.in_(OPEN_STATUSES),
+            Ticket.sla_due == sla_due,
+            Ticket.sla_alert.is_(None) if alert is None else Ticket.sla_alert == alert,
+        ).update(values, synchronize_session=False)
+        db.commit()
+        if claimed != 1:
+            continue  # Another worker got there first, or the ticket changed since we read it
+        counts[new_alert] += 1
+        shared_state.publish(SLA_ALERTS_CHANNEL, {
+            "event": new_alert,
+            "ticket_id": ticket_id,
+            "title": title,
+            "priority": priority,
+            "sla_due": sla_due.isoformat(),
+        })
     db.close()
+    return counts
 
-    # Convert sensor dictionaries into arrays for easier frontend rendering
-    properties_list = list(properties_dict.values())
-    for p in properties_list:
-        p["sensors"] = list(p["sensors"].values())
+SLA_SCAN_INTERVAL = int(os.getenv("SLA_SCAN_INTERVAL", "300"))  # seconds
 
-    return {
-        "status": "Online",
-        "properties": properties_list,
-        "risk_level": highest_risk
-    }
+async def sla_scan_loop():
+    while True:
+        try:
+            await asyncio.to_thread(scan_sla_breaches)
+        except Exception as e:
+            print(f"SLA scan failed: {e}")
+        await asyncio.sleep(SLA_SCAN_INTERVAL)
 
 # --- Ticket Endpoints ---
-@app.post("/tickets", response_model=TicketResponse)
+@router.post("/tickets", response_model=TicketResponse)
 def create_ticket(ticket: CreateTicket):
     db = SessionLocal()
     db_ticket = Ticket(**ticket.dict(), status="Open", created_at=datetime.utcnow())
+    apply_sla(db_ticket, db_ticket.created_at)
     db.add(db_ticket)
     db.commit()
     db.refresh(db_ticket)
     db.close()
+    get_ticket_index().ticket_changed(db_ticket.id)
     return db_ticket
 
-@app.get("/tickets", response_model=list[TicketResponse])
+def _enrich_ticket(t, users: dict, props: list) -> dict:
+    # Mocking the JOIN
+    mock_user = users.get(t.user_id)
+    # Deterministic mock property based on User ID hash
+    mock_prop = props[t.user_id % len(props)] if props else None
+    return {
+        "id": t.id,
+        "user_id": t.user_id,
+        "title": t.title,
+        "description": t.description,
+        "status": t.status,
+        "priority": t.priority,
+        "category": t.category,
+        "created_at": t.created_at,
+        "sla_due": t.sla_due,
+        "resolved_at": t.resolved_at,
+        "sla_breached": t.sla_breached,
+        "tenant_name": mock_user.name if mock_user else "Unknown",
+        "property_address": mock_prop.address if mock_prop else "Unknown",
+        "property_risk_level": mock_prop.risk_level if mock_prop else "Low"
+    }
+
+@router.get("/tickets", response_model=list[TicketResponse])
 def get_tickets():
     db = SessionLocal()
     tickets = db.query(Ticket).all()
     
     # Enrich with mock data for MVP (since we don't have full relationships yet)
     # In prod, this would be a JOIN query
-    enriched_tickets = []
     users = {u.id: u for u in db.query(User).all()}
     # Mock property association logic (User -> Property)
-    # For MVP, we'll just grab a random property to show the UI
-    import random
     props = db.query(Property).all()
-    
-    for t in tickets:
-        # Mocking the JOIN
-        mock_user = users.get(t.user_id)
-        # Deterministic mock property based on User ID hash
-        mock_prop = props[t.user_id % len(props)] if props else None
-        
-        t_dict = {
-            "id": t.id,
-            "user_id": t.user_id,
-            "title": t.title,
-            "description": t.description,
-            "status": t.status,
-            "priority": t.priority,
-            "category": t.category,
-            "created_at": t.created_at,
-            "sla_due": t.sla_due,
-            "tenant_name": mock_user.name if mock_user else "Unknown",
-            "property_address": mock_prop.address if mock_prop else "Unknown",
-            "property_risk_level": mock_prop.risk_level if mock_prop else "Low"
-        }
-        enriched_tickets.append(t_dict)
+    enriched_tickets = [_enrich_ticket(t, users, props) for t in tickets]
         
     db.close()
     return enriched_tickets
 
-@app.patch("/tickets/{ticket_id}")
+@router.get("/tickets/search", response_model=list[TicketSearchResult])
+def search_tickets(q: str, status: str | None = None, category: str | None = None,
+                   priority: str | None = None, limit: int = 50):
+    """
+    Ranked full-text search over ticket titles and descriptions, e.g. ?q=damp&status=Open.
+    Words match as prefixes and all of them must appear.
+    """
+    hits = get_ticket_index().search(q, status, category, priority, max(1, min(limit, 200)))
+    if not hits:
+        return []
+    db = SessionLocal()
+    tickets = {t.id: t for t in db.query(Ticket).filter(Ticket.id.in_([ticket_id for ticket_id, _ in hits]))}
+    users = {u.id: u for u in db.query(User).all()}
+    props = db.query(Property).all()
+    results = [
+        {**_enrich_ticket(tickets[ticket_id], users, props), "score": round(score, 4)}
+        for ticket_id, score in hits if ticket_id in tickets
+    ]
+    db.close()
+    return results
+
+@router.patch("/tickets/{ticket_id}")
 def update_ticket_status(ticket_id: int, status: str):
     db = SessionLocal()
     ticket = db.query(Ticket).filter(Ticket.id == ticket_id).first()
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
+    before = sla_outcome(ticket)
     ticket.status = status
+    apply_sla(ticket, datetime.utcnow())
+    record_sla_outcome(db, before, sla_outcome(ticket))
     db.commit()
     db.close()
+    get_ticket_index().ticket_changed(ticket_id)
     return {"message": "Updated"}
 
 class UpdateTicket(BaseModel):
@@ -400,7 +792,7 @@ class UpdateTicket(BaseModel):
     category: str | None = None
     status: str | None = None
 
-@app.put("/tickets/{ticket_id}", response_model=TicketResponse)
+@router.put("/tickets/{ticket_id}", response_model=TicketResponse)
 def update_ticket(ticket_id: int, ticket_update: UpdateTicket):
     db = SessionLocal()
     ticket = db.query(Ticket).filter(Ticket.id == ticket_id).first()
@@ -408,53 +800,45 @@ def update_ticket(ticket_id: int, ticket_update: UpdateTicket):
         db.close()
         raise HTTPException(status_code=404, detail="Ticket not found")
     
+    before = sla_outcome(ticket)
+    priority_changed = bool(ticket_update.priority) and ticket_update.priority != ticket.priority
+
     if ticket_update.title: ticket.title = ticket_update.title
     if ticket_update.description: ticket.description = ticket_update.description
     if ticket_update.priority: ticket.priority = ticket_update.priority
     if ticket_update.category: ticket.category = ticket_update.category
     if ticket_update.status: ticket.status = ticket_update.status
-    
+
+    apply_sla(ticket, datetime.utcnow(), priority_changed)
+    record_sla_outcome(db, before, sla_outcome(ticket))
     db.commit()
     db.refresh(ticket)
+    get_ticket_index().ticket_changed(ticket.id)
     
-    # Enrich response (copy logic for now, ideally helper function)
+    # Enrich response
     users = {u.id: u for u in db.query(User).all()}
     props = db.query(Property).all()
-    mock_user = users.get(ticket.user_id)
-    mock_prop = props[ticket.user_id % len(props)] if props else None
-    
-    t_dict = {
-        "id": ticket.id,
-        "user_id": ticket.user_id,
-        "title": ticket.title,
-        "description": ticket.description,
-        "status": ticket.status,
-        "priority": ticket.priority,
-        "category": ticket.category,
-        "created_at": ticket.created_at,
-        "sla_due": ticket.sla_due,
-        "tenant_name": mock_user.name if mock_user else "Unknown",
-        "property_address": mock_prop.address if mock_prop else "Unknown",
-        "property_risk_level": mock_prop.risk_level if mock_prop else "Low"
-    }
+    t_dict = _enrich_ticket(ticket, users, props)
     
     db.close()
     return t_dict
 
-@app.delete("/tickets/{ticket_id}")
+@router.delete("/tickets/{ticket_id}")
 def delete_ticket(ticket_id: int):
     db = SessionLocal()
     ticket = db.query(Ticket).filter(Ticket.id == ticket_id).first()
     if not ticket:
         db.close()
         raise HTTPException(status_code=404, detail="Ticket not found")
+    record_sla_outcome(db, sla_outcome(ticket), None)
     db.delete(ticket)
     db.commit()
     db.close()
+    get_ticket_index().ticket_changed(ticket_id)
     return {"message": "Ticket deleted"}
 
 # --- User Endpoints ---
-@app.post("/users", response_model=UserResponse)
+@router.post("/users", response_model=UserResponse)
 def create_user(user: CreateUser):
     db = SessionLocal()
     db_user = User(**user.dict())
@@ -464,14 +848,14 @@ def create_user(user: CreateUser):
     db.close()
     return db_user
 
-@app.get("/users", response_model=list[UserResponse])
+@router.get("/users", response_model=list[UserResponse])
 def get_users():
     db = SessionLocal()
     users = db.query(User).all()
     db.close()
     return users
 
-@app.delete("/users/{user_id}")
+@router.delete("/users/{user_id}")
 def delete_user(user_id: int):
     db = SessionLocal()
     user = db.query(User).filter(User.id == user_id).first()
@@ -485,18 +869,21 @@ def delete_user(user_id: int):
 
 # --- Analytics Endpoints (Phase 5) ---
 
-@app.get("/analytics/kpis")
+@router.get("/analytics/kpis")
 def get_analytics_kpis():
+    bands = _sla_percentages()
+    resolved = sum(b["resolved"] for b in bands)
+    repairs_sla = round(sum(b["met"] * b["resolved"] for b in bands) / resolved) if resolved else 100
     return [
         {"label": "Occupancy Rate", "value": "97.2%", "target": ">95%", "status": "Good"},
         {"label": "Rent Collected", "value": "98.1%", "target": ">97%", "status": "Good"},
-        {"label": "Repairs SLA", "value": "89%", "target": ">85%", "status": "Good"},
+        {"label": "Repairs SLA", "value": f"{repairs_sla}%", "target": ">85%", "status": "Good" if repairs_sla > 85 else "Warning"},
         {"label": "TSM Score", "value": "78/100", "target": ">75", "status": "Good"},
         {"label": "Complaints Resolved", "value": "91%", "target": ">90%", "status": "Good"},
         {"label": "Gas Safety", "value": "100%", "target": "100%", "status": "Good"},
     ]
 
-@app.get("/analytics/risk-evolution")
+@router.get("/analytics/risk-evolution")
 def get_risk_evolution():
     # Mock data for last 30 days
     data = []
@@ -512,7 +899,7 @@ def get_risk_evolution():
         data.append({"date": date, "High": high, "Medium": medium, "Low": low})
     return data
 
-@app.get("/analytics/ticket-trends")
+@router.get("/analytics/ticket-trends")
 def get_ticket_trends():
     # Mock data for last 6 months
     data = []
@@ -526,15 +913,28 @@ def get_ticket_trends():
         data.append({"month": m, "Tenant": tenant, "IoT": iot, "Staff": staff})
     return data
 
-@app.get("/analytics/sla-performance")
+def _sla_percentages() -> list[dict]:
+    db = SessionLocal()
+    stats = {s.band: s for s in db.query(SlaStats).all()}
+    db.close()
+    results = []
+    for band, (window, target) in SLA_BANDS.items():
+        s = stats.get(band)
+        met, breached = (s.met or 0, s.breached or 0) if s else (0, 0)
+        total = met + breached
+        results.append({
+            "category": BAND_LABELS[band],
+            "met": round(100 * met / total) if total else 100,  # Nothing resolved yet = nothing missed
+            "target": target,
+            "resolved": total,
+        })
+    return results
+
+@router.get("/analytics/sla-performance")
 def get_sla_performance():
-    return [
-        {"category": "Emergency (<24h)", "met": 92, "target": 90},
-        {"category": "Urgent (<48h)", "met": 87, "target": 85},
-        {"category": "Routine (<7d)", "met": 76, "target": 85},
-    ]
+    return _sla_percentages()
 
-@app.get("/analytics/roi")
+@router.get("/analytics/roi")
 def get_roi():
     return {
         "reactive_avoided": 14200,
@@ -542,7 +942,7 @@ def get_roi():
         "vs_target_percent": 142
     }
 
-@app.get("/analytics/property-health")
+@router.get("/analytics/property-health")
 def get_property_health():
     return [
         {"grade": "A+ Excellent", "count": 12, "fill": "#10b981"}, # Emerald 500
@@ -552,7 +952,7 @@ def get_property_health():
         {"grade": "D Critical", "count": 1, "fill": "#ef4444"}, # Red 500
     ]
 
-@app.get("/analytics/tenant-load")
+@router.get("/analytics/tenant-load")
 def get_tenant_load():
     return [
         {"name": "Sarah", "tickets": 42, "avg_time": 2.1, "performance": "Excellent"},
@@ -560,5 +960,66 @@ def get_tenant_load():
         {"name": "Jamal", "tickets": 19, "avg_time": 6.1, "performance": "Warning"},
     ]
 
+# --- App Factory ---
+# Nothing touches the database at import time; schema setup and warm-up happen in the
+# lifespan hook (or ahead of time with `python main.py migrate`).
+
+def warm_up_ticket_index():
+    # Runs in the background so a large ticket table doesn't hold up startup
+    try:
+        get_ticket_index().warm_up()
+    except Exception as e:
+        print(f"Ticket index warm-up failed, it will load on first search: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    if AUTO_MIGRATE:
+        init_db()
+    warm_up = asyncio.create_task(asyncio.to_thread(warm_up_ticket_index))
+    scanner = asyncio.create_task(sla_scan_loop())
+    ready = time.perf_counter()
+    app.state.startup_ms = {
+        "import": round((_IMPORT_FINISHED - _IMPORT_STARTED) * 1000),
+        "startup": round((ready - started) * 1000),
+    }
+    print(f"PropSense API ready: import {app.state.startup_ms['import']} ms, "
+          f"startup {app.state.startup_ms['startup']} ms (migrations {'on' if AUTO_MIGRATE else 'off'})")
+    yield
+    scanner.cancel()
+    warm_up.cancel()
+    engine.dispose()
+
+def create_app() -> FastAPI:
+    app = FastAPI(title="PropSense AI API", lifespan=lifespan)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"], # Allow all origins for dev to avoid any port mismatch issues
+        allow_credentials=False, # Must be False if allow_origins=["*"] to prevent browser CORS errors
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.include_router(router)
+    return app
+
+app = create_app()
+_IMPORT_FINISHED = time.perf_counter()
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    if sys.argv[1:] == ["migrate"]:
+        started = time.perf_counter()
+        init_db()
+        print(f"Database schema up to date ({(time.perf_counter() - started) * 1000:.0f} ms)")
+        sys.exit(0)
+
+    import uvicorn
+    # WEB_CONCURRENCY > 1 starts several worker processes. Set SHARED_STATE_URL to a
+    # sqlite:/// or redis:// backend so caches and live updates are shared between them.
+    # For production use gunicorn instead: `gunicorn -c gunicorn.conf.py main:app`
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    if workers > 1:
+        if os.getenv("SHARED_STATE_URL", "memory://").startswith("memory://"):
+            print("Warning: SHARED_STATE_URL is memory://, each worker will keep its own state.")
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
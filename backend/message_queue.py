@@ -0,0 +1,195 @@
+import json
+import os
+import threading
+import time
+import zlib
+from collections import deque
+
+# --- Device Message Queues ---
+# Stand-ins for the Azure IoT Hub (Event Hub compatible) endpoint, so telemetry can be
+# produced by sim.py and consumed by iot_consumer.py without a cloud connection.
+# Delivery is at-least-once: anything received but not acked is handed out again, and
+# the ingest path drops the repeats using the readings' sequence numbers.
+
+
+class QueueMessage:
+    __slots__ = ("partition", "offset", "body", "error")
+
+    def __init__(self, partition: int, offset: int, body: dict, error: Exception | None = None):
+        self.partition = partition
+        self.offset = offset  # Position to resume from once this message is acked
+        self.body = body
+        self.error = error  # Set if the message couldn't be decoded; body is then {"raw": ...}
+
+
+def partition_for(key: str, partitions: int) -> int:
+    """Stable across processes (unlike hash()), so a sensor always maps to one partition."""
+    return zlib.crc32(key.encode()) % partitions
+
+
+class MessageQueue:
+    """
+    Interface for a partitioned queue. Each partition must only be consumed by one
+    worker at a time, which keeps a sensor's readings in order.
+    """
+    partitions: int
+
+    def send(self, body: dict, key: str | None = None):
+        raise NotImplementedError
+
+    def receive(self, partition: int, max_messages: int = 500, timeout: float = 1.0) -> list[QueueMessage]:
+        """Returns up to max_messages, waiting at most `timeout` seconds for the first one."""
+        raise NotImplementedError
+
+    def ack(self, partition: int, messages: list[QueueMessage]):
+        """Marks everything up to the last message as processed."""
+        raise NotImplementedError
+
+    def release(self, partition: int, messages: list[QueueMessage]):
+        """Gives unprocessed messages back so the next receive() returns them again."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class InProcessQueue(MessageQueue):
+    """
+    Memory-only queue for tests and for running producer and consumer in one process.
+    """
+
+    def __init__(self, partitions: int = 4):
+        self.partitions = partitions
+        self._pending = [deque() for _ in range(partitions)]
+        self._in_flight = [deque() for _ in range(partitions)]
+        self._offsets = [0] * partitions
+        self._cond = threading.Condition()
+
+    def send(self, body, key=None):
+        partition = partition_for(key or body.get("sensor_id", ""), self.partitions)
+        with self._cond:
+            self._offsets[partition] += 1
+            self._pending[partition].append(QueueMessage(partition, self._offsets[partition], body))
+            self._cond.notify_all()
+
+    def receive(self, partition, max_messages=500, timeout=1.0):
+        with self._cond:
+            pending = self._pending[partition]
+            if not pending:
+                self._cond.wait_for(lambda: pending, timeout)
+            batch = [pending.popleft() for _ in range(min(max_messages, len(pending)))]
+            self._in_flight[partition].extend(batch)
+            return batch
+
+    def ack(self, partition, messages):
+        if not messages:
+            return
+        last = messages[-1].offset
+        with self._cond:
+            in_flight = self._in_flight[partition]
+            while in_flight and in_flight[0].offset <= last:
+                in_flight.popleft()
+
+    def release(self, partition, messages):
+        with self._cond:
+            # Everything in flight goes back to the front, oldest first
+            in_flight = self._in_flight[partition]
+            self._pending[partition].extendleft(reversed(in_flight))
+            in_flight.clear()
+            self._cond.notify_all()
+
+
+class FileQueue(MessageQueue):
+    """
+    Durable local queue: one append-only JSON-lines log per partition plus a file
+    holding the committed byte offset. Producers and consumers can be separate
+    processes; after a crash the consumer resumes from the last ack.
+    """
+
+    def __init__(self, directory: str, partitions: int = 4, poll_interval: float = 0.2):
+        self.directory = directory
+        self.partitions = partitions
+        self._poll_interval = poll_interval
+        os.makedirs(directory, exist_ok=True)
+        self._write_lock = threading.Lock()
+        self._read_pos = [self._committed(p) for p in range(partitions)]
+
+    def _log_path(self, partition):
+        return os.path.join(self.directory, f"partition-{partition}.log")
+
+    def _offset_path(self, partition):
+        return os.path.join(self.directory, f"partition-{partition}.offset")
+
+    def _committed(self, partition) -> int:
+        try:
+            with open(self._offset_path(partition)) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def send(self, body, key=None):
+        partition = partition_for(key or body.get("sensor_id", ""), self.partitions)
+        line = (json.dumps(body, default=str) + "\n").encode()
+        with self._write_lock:
+            # O_APPEND keeps whole lines together even with several producer processes
+            fd = os.open(self._log_path(partition), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+
+    def receive(self, partition, max_messages=500, timeout=1.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            batch = self._read(partition, max_messages)
+            if batch or time.monotonic() >= deadline:
+                return batch
+            time.sleep(self._poll_interval)
+
+    def _read(self, partition, max_messages):
+        try:
+            f = open(self._log_path(partition), "rb")
+        except FileNotFoundError:
+            return []
+        batch = []
+        with f:
+            f.seek(self._read_pos[partition])
+            while len(batch) < max_messages:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break  # End of file, or a line the producer is still writing
+                pos = f.tell()
+                try:
+                    batch.append(QueueMessage(partition, pos, json.loads(line)))
+                except ValueError as e:
+                    # Corrupt line: hand it over as-is so the consumer can dead-letter it
+                    raw = line.decode("utf-8", "replace").rstrip("\n")
+                    batch.append(QueueMessage(partition, pos, {"raw": raw}, e))
+                self._read_pos[partition] = pos
+        return batch
+
+    def ack(self, partition, messages):
+        if not messages:
+            return
+        path = self._offset_path(partition)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(str(messages[-1].offset))
+        os.replace(tmp, path)
+
+    def release(self, partition, messages):
+        self._read_pos[partition] = self._committed(partition)
+
+
+def create_queue(url: str | None = None, partitions: int | None = None) -> MessageQueue:
+    """
+    LOCAL_QUEUE_URL=memory://         in-process (tests)
+    LOCAL_QUEUE_URL=file://./queue    directory of partition logs
+    """
+    url = url or os.getenv("LOCAL_QUEUE_URL", "file://./queue")
+    partitions = partitions or int(os.getenv("LOCAL_QUEUE_PARTITIONS", "4"))
+    if url.startswith("memory://"):
+        return InProcessQueue(partitions)
+    if url.startswith("file://"):
+        return FileQueue(url[len("file://"):], partitions)
+    raise ValueError(f"Unsupported LOCAL_QUEUE_URL: {url}")
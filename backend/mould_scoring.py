@@ -0,0 +1,288 @@
+# --- Predictive Damp & Mould Risk (batch job) ---
+#
+# Streams every property's environmental readings out of `sensor_readings` in chunks,
+# turns them into a few physically meaningful features with NumPy, scores them with a
+# small logistic regression model and writes one row per property to
+# `property_mould_scores`.
+#
+#     python mould_scoring.py                      # score everything, one process per core
+#     python mould_scoring.py --workers 4 --chunk-size 20000
+#     python mould_scoring.py --weights weights.json
+#
+# Memory use is bounded by the chunk size plus a few floats per property, never by the
+# number of readings, so it works through millions of rows on a laptop.
+import argparse
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import create_engine, select
+
+from main import AUTO_MIGRATE, DATABASE_URL, SensorReading, MouldRiskScore, init_db
+
+DEFAULT_CHUNK_SIZE = 10000
+MAX_GAP_SECONDS = 3600  # A gap longer than this (sensor offline) isn't counted as observed time
+
+DAMP_HUMIDITY = 70.0
+COLD_TEMP = 18.0
+DEW_POINT_MARGIN = 3.0  # Surfaces a few degrees colder than the air reach the dew point
+
+FEATURE_NAMES = [
+    "damp_fraction",          # Share of observed time with humidity > 70%
+    "dew_point_fraction",     # Share of time the air was within 3°C of its dew point
+    "cold_damp_fraction",     # Share of time both damp and below 18°C
+    "mean_humidity",          # Time-weighted mean relative humidity, 0-1
+    "longest_damp_days",      # Longest unbroken damp spell, log(1 + days)
+]
+
+# Hand-set starting weights, in the same order as FEATURE_NAMES. Replace them with
+# fitted ones (see fit_logistic_regression) once we have labelled outcomes.
+DEFAULT_WEIGHTS = {
+    "intercept": -5.0,
+    "coef": [3.0, 2.5, 4.0, 3.0, 1.5],
+}
+
+RISK_THRESHOLDS = (("High", 0.7), ("Medium", 0.4))
+
+
+# --- Feature Extraction ---
+
+def dew_point(temp: np.ndarray, humidity: np.ndarray) -> np.ndarray:
+    """Magnus formula, good to ~0.4°C for normal indoor conditions."""
+    b, c = 17.62, 243.12
+    gamma = np.log(np.clip(humidity, 1.0, 100.0) / 100.0) + b * temp / (c + temp)
+    return c * gamma / (b - gamma)
+
+
+class PropertyFeatures:
+    """
+    Running time-weighted totals for one property. Chunks are fed in timestamp order;
+    only the last timestamp and the open damp spell are carried between them.
+    """
+    __slots__ = ("hours", "damp_hours", "dew_hours", "cold_damp_hours",
+                 "humidity_hours", "longest_damp", "open_damp", "last_ts", "readings")
+
+    def __init__(self):
+        self.hours = 0.0
+        self.damp_hours = 0.0
+        self.dew_hours = 0.0
+        self.cold_damp_hours = 0.0
+        self.humidity_hours = 0.0
+        self.longest_damp = 0.0
+        self.open_damp = 0.0
+        self.last_ts = None
+        self.readings = 0
+
+    def update(self, ts: np.ndarray, temp: np.ndarray, humidity: np.ndarray):
+        # Each reading stands for the time since the previous one
+        prev = np.empty_like(ts)
+        prev[0] = self.last_ts if self.last_ts is not None else ts[0]
+        prev[1:] = ts[:-1]
+        dt = ts - prev
+        dt[(dt < 0) | (dt > MAX_GAP_SECONDS)] = 0.0
+        dt /= 3600.0
+
+        damp = humidity > DAMP_HUMIDITY
+        near_dew = (temp - dew_point(temp, humidity)) < DEW_POINT_MARGIN
+
+        self.hours += dt.sum()
+        self.damp_hours += dt[damp].sum()
+        self.dew_hours += dt[near_dew].sum()
+        self.cold_damp_hours += dt[damp & (temp < COLD_TEMP)].sum()
+        self.humidity_hours += (dt * humidity).sum()
+
+        # Length of each damp spell: cumulative damp time minus the total at the last dry reading
+        damp_time = np.cumsum(np.where(damp, dt, 0.0))
+        last_dry = np.maximum.accumulate(np.where(damp, 0.0, damp_time))
+        spell = damp_time - last_dry
+        # The spell still open at the end of the previous chunk continues until the first dry reading
+        spell[np.cumsum(~damp) == 0] += self.open_damp
+        self.longest_damp = max(self.longest_damp, float(spell.max()))
+        self.open_damp = float(spell[-1]) if damp[-1] else 0.0
+
+        self.last_ts = float(ts[-1])
+        self.readings += len(ts)
+
+    def vector(self) -> np.ndarray:
+        hours = self.hours or 1.0
+        return np.array([
+            self.damp_hours / hours,
+            self.dew_hours / hours,
+            self.cold_damp_hours / hours,
+            self.humidity_hours / hours / 100.0,
+            math.log1p(self.longest_damp / 24.0),
+        ])
+
+
+def _parse_chunk(rows):
+    """
+    Turns (property_id, payload, timestamp) rows into arrays, dropping readings
+    without both temp and humidity.
+    """
+    pids, ts, temp, humidity = [], [], [], []
+    for property_id, payload, timestamp in rows:
+        try:
+            data = json.loads(payload) if payload else {}
+            t, h = float(data["temp"]), float(data["humidity"])
+        except (ValueError, KeyError, TypeError):
+            continue
+        pids.append(property_id)
+        ts.append(timestamp.timestamp())
+        temp.append(t)
+        humidity.append(h)
+    return np.array(pids), np.array(ts), np.array(temp), np.array(humidity)
+
+
+def extract_features(property_range: tuple[int, int], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                     database_url: str = DATABASE_URL) -> dict[int, tuple[list[float], int]]:
+    """
+    Streams environmental readings for properties lo..hi (inclusive) and returns
+    {property_id: (feature_vector, readings_used)}. Runs inside a worker process.
+    """
+    lo, hi = property_range
+    engine = create_engine(database_url)
+    table = SensorReading.__table__
+    stmt = (
+        select(table.c.property_id, table.c.payload, table.c.timestamp)
+        .where(table.c.sensor_type == "environmental")
+        .where(table.c.property_id.between(lo, hi))
+        .where(table.c.timestamp.is_not(None))
+        .order_by(table.c.property_id, table.c.timestamp)
+    )
+
+    features: dict[int, PropertyFeatures] = {}
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True).execute(stmt)
+        for rows in result.partitions(chunk_size):
+            pids, ts, temp, humidity = _parse_chunk(rows)
+            if not len(pids):
+                continue
+            # Rows are sorted by property, so each property is one contiguous slice
+            starts = np.flatnonzero(np.r_[True, pids[1:] != pids[:-1]])
+            ends = np.r_[starts[1:], len(pids)]
+            for start, end in zip(starts, ends):
+                pid = int(pids[start])
+                acc = features.get(pid)
+                if acc is None:
+                    acc = features[pid] = PropertyFeatures()
+                acc.update(ts[start:end], temp[start:end], humidity[start:end])
+    engine.dispose()
+
+    return {pid: (acc.vector().tolist(), acc.readings) for pid, acc in features.items()}
+
+
+# --- Model ---
+
+def sigmoid(z: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-z))
+
+
+def predict(X: np.ndarray, weights: dict = DEFAULT_WEIGHTS) -> np.ndarray:
+    return sigmoid(X @ np.asarray(weights["coef"]) + weights["intercept"])
+
+
+def fit_logistic_regression(X: np.ndarray, y: np.ndarray, l2: float = 0.01,
+                            lr: float = 0.5, epochs: int = 2000) -> dict:
+    """
+    Plain batch gradient descent; the feature count is tiny so this is instant.
+    Returns weights in the same shape as DEFAULT_WEIGHTS (save with json.dump).
+    """
+    n, k = X.shape
+    coef, intercept = np.zeros(k), 0.0
+    for _ in range(epochs):
+        err = sigmoid(X @ coef + intercept) - y
+        coef -= lr * (X.T @ err / n + l2 * coef)
+        intercept -= lr * err.mean()
+    return {"intercept": float(intercept), "coef": coef.tolist()}
+
+
+def risk_level(score: float) -> str:
+    for level, threshold in RISK_THRESHOLDS:
+        if score >= threshold:
+            return level
+    return "Low"
+
+
+# --- Batch Job ---
+
+def partition_properties(property_ids: list[int], parts: int) -> list[tuple[int, int]]:
+    """
+    Splits sorted ids into contiguous ranges so each worker does an indexed range scan.
+    """
+    property_ids = sorted(property_ids)
+    if not property_ids:
+        return []
+    parts = max(1, min(parts, len(property_ids)))
+    return [(int(chunk[0]), int(chunk[-1])) for chunk in np.array_split(property_ids, parts)]
+
+
+def run(workers: int | None = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+        weights: dict = DEFAULT_WEIGHTS, database_url: str = DATABASE_URL) -> int:
+    engine = create_engine(database_url)
+    table = SensorReading.__table__
+    with engine.connect() as conn:
+        property_ids = [row[0] for row in conn.execute(
+            select(table.c.property_id).distinct()
+            .where(table.c.sensor_type == "environmental")
+            .where(table.c.property_id.is_not(None))
+        )]
+
+    ranges = partition_properties(property_ids, workers or os.cpu_count() or 1)
+    features = {}
+    if len(ranges) > 1:
+        with ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+            for part in pool.map(extract_features, ranges, [chunk_size] * len(ranges),
+                                 [database_url] * len(ranges)):
+                features.update(part)
+    elif ranges:
+        features = extract_features(ranges[0], chunk_size, database_url)
+
+    if not features:
+        engine.dispose()
+        return 0
+
+    pids = list(features)
+    X = np.array([features[pid][0] for pid in pids])
+    scores = predict(X, weights)
+
+    now = datetime.utcnow()
+    rows = [
+        {
+            "property_id": pid,
+            "score": float(score),
+            "risk_level": risk_level(score),
+            "features": json.dumps(dict(zip(FEATURE_NAMES, (round(v, 4) for v in features[pid][0])))),
+            "readings_used": features[pid][1],
+            "scored_at": now,
+        }
+        for pid, score in zip(pids, scores)
+    ]
+    score_table = MouldRiskScore.__table__
+    with engine.begin() as conn:
+        conn.execute(score_table.delete().where(score_table.c.property_id.in_(pids)))
+        conn.execute(score_table.insert(), rows)
+    engine.dispose()
+    return len(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score every property for damp & mould risk.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per core)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows fetched per chunk")
+    parser.add_argument("--weights", help="JSON file with fitted model weights")
+    args = parser.parse_args()
+
+    model = DEFAULT_WEIGHTS
+    if args.weights:
+        with open(args.weights) as f:
+            model = json.load(f)
+
+    if AUTO_MIGRATE:
+        init_db()
+    started = time.perf_counter()
+    scored = run(args.workers, args.chunk_size, model)
+    print(f"Scored {scored} properties in {time.perf_counter() - started:.1f}s")
@@ -1,6 +1,7 @@
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import create_engine
-from main import Base, User, Ticket, Property, DATABASE_URL
+from main import Base, User, Ticket, Property, DATABASE_URL, shared_state, PROPERTIES_CACHE_KEY, rebuild_sla_stats, init_db, get_ticket_index
+from sla import apply_sla
 from datetime import datetime
 import random
 
@@ -14,7 +15,7 @@ def seed_data():
     # 1. Clear existing data and recreation tables to ensure schema is correct
     print("Dropping and recreating tables...")
     Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
+    init_db()
 
     # 2. Add Users (Tenants)
     tenant_names = [
@@ -91,7 +92,7 @@ def seed_data():
         category = "Damp & Mould" if "Mould" in issue or "Damp" in issue else "Plumbing" if "water" in issue or "leak" in issue else "General"
         
         from datetime import timedelta
-        sla_due = datetime.utcnow() + timedelta(days=random.randint(1, 3))
+        created_at = datetime.utcnow() - timedelta(hours=random.randint(1, 24 * 10))
 
         ticket = Ticket(
             user_id=user.id,
@@ -100,12 +101,20 @@ def seed_data():
             status=status,
             priority=priority,
             category=category,
-            created_at=datetime.utcnow(),
-            sla_due=sla_due
+            created_at=created_at
         )
+        # Resolved tickets get a plausible fix time, then SLA fields follow the policy
+        if status == "Resolved":
+            ticket.resolved_at = created_at + timedelta(hours=random.randint(2, 24 * 8))
+        apply_sla(ticket, datetime.utcnow())
         db.add(ticket)
     
     db.commit()
+    rebuild_sla_stats(db)
+    # Tables were dropped and recreated, so the search index needs rebuilding too
+    get_ticket_index().rebuild()
+    # Running API workers may still be serving the old property list
+    shared_state.invalidate(PROPERTIES_CACHE_KEY)
     print("Database seeded successfully!")
     print(f"   - {len(users)} Users generated")
     print(f"   - {len(properties) + 1} Properties generated with Lat/Long coords")
@@ -0,0 +1,396 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# --- Shared State Backends ---
+# When the API runs with several worker processes, anything kept in a module-level
+# dict is private to one worker. Everything that has to be seen by *all* workers
+# (cache entries, the latest reading per sensor, live-update events) goes through
+# one of these backends instead.
+#
+#   SHARED_STATE_URL=memory://                 -> single process only (default)
+#   SHARED_STATE_URL=sqlite:///./shared.db     -> several workers on one machine
+#   SHARED_STATE_URL=redis://localhost:6379/0  -> several machines (needs `redis`)
+
+DEFAULT_EVENT_RETENTION = 5000  # Events kept per channel for late subscribers
+
+
+class SharedState:
+    """
+    Interface every backend implements. Values are plain JSON-serialisable data.
+    """
+    _retention = DEFAULT_EVENT_RETENTION
+
+    # Cache
+    def cache_get(self, key: str):
+        raise NotImplementedError
+
+    def cache_set(self, key: str, value, ttl: float | None = None):
+        raise NotImplementedError
+
+    def invalidate(self, *keys: str):
+        raise NotImplementedError
+
+    # Latest state per sensor
+    def set_latest(self, sensor_id: str, record: dict) -> bool:
+        """
+        Stores the record unless the stored one is newer, so the latest state never
+        moves backwards when readings arrive out of order. Records are ordered by
+        ("epoch", "sequence"), a missing epoch counting as 0. If either record has
+        no sequence they're ordered by "timestamp" (naive ISO strings, which sort
+        as text); a record missing that too always applies. Returns False if the
+        record was older and ignored.
+        """
+        raise NotImplementedError
+
+    def get_latest(self, sensor_id: str) -> dict | None:
+        raise NotImplementedError
+
+    def all_latest(self) -> dict:
+        raise NotImplementedError
+
+    # Live-update fan-out
+    def publish(self, channel: str, message: dict) -> int:
+        raise NotImplementedError
+
+    def read_since(self, channel: str, after_id: int = 0, limit: int = 100) -> list[tuple[int, dict]]:
+        """
+        Returns (event_id, message) pairs newer than after_id, oldest first.
+        Subscribers keep the last id they saw and poll with it.
+        """
+        raise NotImplementedError
+
+    def last_event_id(self, channel: str) -> int:
+        raise NotImplementedError
+
+    def missed_events(self, channel: str, after_id: int) -> bool:
+        """
+        True if events newer than after_id may already have been trimmed, so a
+        subscriber that far behind has to reload its state instead of replaying.
+        """
+        return self.last_event_id(channel) - after_id > self._retention
+
+    def close(self):
+        pass
+
+
+def _is_older(record: dict, current: dict | None) -> bool:
+    if current is None:
+        return False
+    seq, current_seq = record.get("sequence"), current.get("sequence")
+    if seq is None or current_seq is None:
+        ts, current_ts = record.get("timestamp"), current.get("timestamp")
+        return ts is not None and current_ts is not None and ts < current_ts
+    return (record.get("epoch") or 0, seq) < (current.get("epoch") or 0, current_seq)
+
+
+class InMemoryState(SharedState):
+    """
+    Process-local backend. Fine for a single worker and for tests.
+    """
+
+    def __init__(self, retention: int = DEFAULT_EVENT_RETENTION):
+        self._lock = threading.Lock()
+        self._cache = {}  # key -> (value, expires_at | None)
+        self._latest = {}
+        self._events = {}  # channel -> list[(id, message)]
+        self._next_id = {}
+        self._retention = retention
+
+    def cache_get(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.time():
+                del self._cache[key]
+                return None
+            return value
+
+    def cache_set(self, key, value, ttl=None):
+        with self._lock:
+            self._cache[key] = (value, time.time() + ttl if ttl else None)
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._cache.pop(key, None)
+
+    def set_latest(self, sensor_id, record):
+        with self._lock:
+            if _is_older(record, self._latest.get(sensor_id)):
+                return False
+            self._latest[sensor_id] = record
+            return True
+
+    def get_latest(self, sensor_id):
+        with self._lock:
+            return self._latest.get(sensor_id)
+
+    def all_latest(self):
+        with self._lock:
+            return dict(self._latest)
+
+    def publish(self, channel, message):
+        with self._lock:
+            event_id = self._next_id.get(channel, 0) + 1
+            self._next_id[channel] = event_id
+            events = self._events.setdefault(channel, [])
+            events.append((event_id, message))
+            if len(events) > self._retention:
+                del events[: len(events) - self._retention]
+            return event_id
+
+    def read_since(self, channel, after_id=0, limit=100):
+        with self._lock:
+            events = self._events.get(channel, [])
+            # Ids are contiguous, so we can jump straight to the right offset
+            if not events:
+                return []
+            start = max(0, after_id - events[0][0] + 1)
+            return events[start:start + limit]
+
+    def last_event_id(self, channel):
+        with self._lock:
+            return self._next_id.get(channel, 0)
+
+
+class SQLiteState(SharedState):
+    """
+    File-backed backend. Every worker on the host opens the same file, so a write
+    from one worker is visible to the others. Runs in WAL mode so readers never
+    block the ingest path.
+    """
+
+    def __init__(self, path: str, retention: int = DEFAULT_EVENT_RETENTION):
+        self._path = path
+        self._retention = retention
+        self._local = threading.local()
+        db = self._conn()
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS latest (
+                sensor_id TEXT PRIMARY KEY, record TEXT NOT NULL
+            );
+            -- Event ids are counted per channel, like the other backends, so a
+            -- busy channel doesn't make subscribers of a quiet one look behind
+            CREATE TABLE IF NOT EXISTS channels (
+                channel TEXT PRIMARY KEY, last_id INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS channel_events (
+                channel TEXT NOT NULL, id INTEGER NOT NULL, message TEXT NOT NULL,
+                PRIMARY KEY (channel, id)
+            ) WITHOUT ROWID;
+            DROP TABLE IF EXISTS events;  -- Old single-sequence layout
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared across threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def cache_get(self, key):
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at < time.time():
+            self.invalidate(key)
+            return None
+        return json.loads(value)
+
+    def cache_set(self, key, value, ttl=None):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value, default=str), time.time() + ttl if ttl else None),
+        )
+
+    def invalidate(self, *keys):
+        if keys:
+            self._conn().executemany("DELETE FROM cache WHERE key = ?", [(k,) for k in keys])
+
+    def set_latest(self, sensor_id, record):
+        # Same ordering as _is_older, inside the upsert so two workers can't race each other
+        cur = self._conn().execute(
+            """
+            INSERT INTO latest (sensor_id, record) VALUES (?, ?)
+            ON CONFLICT (sensor_id) DO UPDATE SET record = excluded.record
+            WHERE ((json_extract(excluded.record, '$.sequence') IS NULL
+                    OR json_extract(latest.record, '$.sequence') IS NULL)
+                   AND (json_extract(excluded.record, '$.timestamp') IS NULL
+                        OR json_extract(latest.record, '$.timestamp') IS NULL
+                        OR json_extract(excluded.record, '$.timestamp') >= json_extract(latest.record, '$.timestamp')))
+               OR IFNULL(json_extract(excluded.record, '$.epoch'), 0) > IFNULL(json_extract(latest.record, '$.epoch'), 0)
+               OR (IFNULL(json_extract(excluded.record, '$.epoch'), 0) = IFNULL(json_extract(latest.record, '$.epoch'), 0)
+                   AND json_extract(excluded.record, '$.sequence') >= json_extract(latest.record, '$.sequence'))
+            """,
+            (sensor_id, json.dumps(record, default=str)),
+        )
+        return cur.rowcount > 0
+
+    def get_latest(self, sensor_id):
+        row = self._conn().execute(
+            "SELECT record FROM latest WHERE sensor_id = ?", (sensor_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def all_latest(self):
+        rows = self._conn().execute("SELECT sensor_id, record FROM latest").fetchall()
+        return {sensor_id: json.loads(record) for sensor_id, record in rows}
+
+    def publish(self, channel, message):
+        db = self._conn()
+        # Take the write lock up front so two workers can't hand out the same id
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            (event_id,) = db.execute(
+                """
+                INSERT INTO channels (channel, last_id) VALUES (?, 1)
+                ON CONFLICT (channel) DO UPDATE SET last_id = last_id + 1
+                RETURNING last_id
+                """,
+                (channel,),
+            ).fetchone()
+            db.execute(
+                "INSERT INTO channel_events (channel, id, message) VALUES (?, ?, ?)",
+                (channel, event_id, json.dumps(message, default=str)),
+            )
+            # Trim occasionally rather than on every publish
+            if event_id % 500 == 0:
+                db.execute(
+                    "DELETE FROM channel_events WHERE channel = ? AND id <= ?",
+                    (channel, event_id - self._retention),
+                )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return event_id
+
+    def read_since(self, channel, after_id=0, limit=100):
+        rows = self._conn().execute(
+            "SELECT id, message FROM channel_events WHERE channel = ? AND id > ? ORDER BY id LIMIT ?",
+            (channel, after_id, limit),
+        ).fetchall()
+        return [(event_id, json.loads(message)) for event_id, message in rows]
+
+    def last_event_id(self, channel):
+        row = self._conn().execute(
+            "SELECT last_id FROM channels WHERE channel = ?", (channel,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class RedisState(SharedState):
+    """
+    Redis backend for deployments spread over several hosts.
+    """
+
+    def __init__(self, url: str, retention: int = DEFAULT_EVENT_RETENTION, prefix: str = "propsense"):
+        import redis  # Optional dependency, only needed for this backend
+
+        self._r = redis.Redis.from_url(url, decode_responses=True)
+        self._retention = retention
+        self._prefix = prefix
+
+    def _key(self, *parts):
+        return ":".join((self._prefix,) + parts)
+
+    def cache_get(self, key):
+        value = self._r.get(self._key("cache", key))
+        return json.loads(value) if value is not None else None
+
+    def cache_set(self, key, value, ttl=None):
+        self._r.set(self._key("cache", key), json.dumps(value, default=str), ex=int(ttl) if ttl else None)
+
+    def invalidate(self, *keys):
+        if keys:
+            self._r.delete(*[self._key("cache", k) for k in keys])
+
+    # Atomic compare-and-set with the same ordering as _is_older
+    _SET_LATEST_LUA = """
+    local current = redis.call('HGET', KEYS[1], ARGV[1])
+    if current then
+        local held = cjson.decode(current)
+        local seq, epoch, ts = held['sequence'], held['epoch'], held['timestamp']
+        if type(epoch) ~= 'number' then epoch = 0 end
+        if ARGV[3] ~= '' and type(seq) == 'number' then
+            local new_epoch = tonumber(ARGV[4])
+            if epoch > new_epoch or (epoch == new_epoch and seq > tonumber(ARGV[3])) then
+                return 0
+            end
+        elseif ARGV[5] ~= '' and type(ts) == 'string' and ARGV[5] < ts then
+            return 0
+        end
+    end
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+    return 1
+    """
+
+    def set_latest(self, sensor_id, record):
+        seq = record.get("sequence")
+        return bool(self._r.eval(
+            self._SET_LATEST_LUA, 1, self._key("latest"),
+            sensor_id, json.dumps(record, default=str), "" if seq is None else str(seq),
+            str(record.get("epoch") or 0), record.get("timestamp") or "",
+        ))
+
+    def get_latest(self, sensor_id):
+        value = self._r.hget(self._key("latest"), sensor_id)
+        return json.loads(value) if value else None
+
+    def all_latest(self):
+        return {k: json.loads(v) for k, v in self._r.hgetall(self._key("latest")).items()}
+
+    def publish(self, channel, message):
+        # A sorted set scored by our own integer sequence keeps ids identical in
+        # shape to the other backends and lets subscribers range-scan by id.
+        event_id = self._r.incr(self._key("seq", channel))
+        events_key = self._key("events", channel)
+        pipe = self._r.pipeline()
+        pipe.zadd(events_key, {json.dumps({"id": event_id, "message": message}, default=str): event_id})
+        pipe.zremrangebyrank(events_key, 0, -self._retention - 1)
+        pipe.execute()
+        return event_id
+
+    def read_since(self, channel, after_id=0, limit=100):
+        entries = self._r.zrangebyscore(self._key("events", channel), f"({after_id}", "+inf", start=0, num=limit)
+        return [(event["id"], event["message"]) for event in map(json.loads, entries)]
+
+    def last_event_id(self, channel):
+        return int(self._r.get(self._key("seq", channel)) or 0)
+
+    def close(self):
+        self._r.close()
+
+
+def create_shared_state(url: str | None = None) -> SharedState:
+    """
+    Builds the backend described by SHARED_STATE_URL (see top of file).
+    """
+    url = url or os.getenv("SHARED_STATE_URL", "memory://")
+    if url.startswith("memory://"):
+        return InMemoryState()
+    if url.startswith("sqlite:///"):
+        return SQLiteState(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://")):
+        return RedisState(url)
+    raise ValueError(f"Unsupported SHARED_STATE_URL: {url}")
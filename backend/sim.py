@@ -5,7 +5,7 @@ import os
 import requests
 from datetime import datetime
 from dotenv import load_dotenv
-from azure.iot.device import IoTHubDeviceClient, Message
+from message_queue import create_queue
 
 # Load env vars
 load_dotenv()
@@ -14,15 +14,22 @@ load_dotenv()
 API_URL = "http://localhost:8000/sensor-data"
 PROPERTIES_URL = "http://localhost:8000/properties"
 
+# "http" posts every reading to the API, "queue" writes to the local queue read by iot_consumer.py
+SIM_TRANSPORT = os.getenv("SIM_TRANSPORT", "http")
+
 # Azure Config
 CONNECTION_STRING = os.getenv("AZURE_IOT_CONNECTION_STRING")
 
 # Mock Device Config
 DEVICE_ID = "sensor_01"
+# Sequence counters restart with every run, so each run is a new epoch for the backend
+EPOCH = int(time.time())
 
 def get_azure_client():
     if not CONNECTION_STRING:
         return None
+    # Imported here so the SDK is only needed (and loaded) when Azure is configured
+    from azure.iot.device import IoTHubDeviceClient
     try:
         client = IoTHubDeviceClient.create_from_connection_string(CONNECTION_STRING)
         client.connect()
@@ -58,7 +65,8 @@ def init_sensors():
             ASSIGNED_SENSORS.append({
                 "property_id": prop_id,
                 "sensor_id": sensor_id,
-                "type": s_type
+                "type": s_type,
+                "sequence": 0
             })
     print(f"Initialized {len(ASSIGNED_SENSORS)} sensors across {len(properties)} properties.")
 
@@ -146,6 +154,12 @@ def generate_telemetry():
             data = generate_communal(s["sensor_id"])
             
         data["property_id"] = s["property_id"]
+        # Per-sensor counter: lets the backend drop retried/duplicate deliveries
+        s["sequence"] += 1
+        data["sequence"] = s["sequence"]
+        data["epoch"] = EPOCH
+        # Taken now, even if it sits in the queue for a while before it's ingested
+        data["timestamp"] = datetime.now().astimezone().isoformat()
         batch.append(data)
         
     return batch
@@ -156,6 +170,10 @@ def main():
     azure_client = get_azure_client()
     if not azure_client:
         print("Running in LOCAL ONLY mode (No Azure Connection String found).")
+
+    local_queue = create_queue() if SIM_TRANSPORT == "queue" else None
+    if local_queue:
+        print(f"Writing telemetry to the local queue ({local_queue.partitions} partitions) instead of the API.")
     
     print("Press Ctrl+C to stop.")
     
@@ -163,15 +181,20 @@ def main():
         sensor_batch = generate_telemetry()
         
         for data in sensor_batch:
-            # 1. Send to Local API (PropSense Backend)
-            try:
-                response = requests.post(API_URL, json=data)
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] Sent {data['sensor_type']}: {data['payload']} -> API Status: {response.status_code} | Risk: {response.json().get('risk_evaluation')}")
-            except Exception as e:
-                print(f"Error sending to API: {e}")
+            # 1. Send to Local API (PropSense Backend), or to the local queue
+            if local_queue:
+                local_queue.send(data)
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] Queued {data['sensor_type']}: {data['payload']}")
+            else:
+                try:
+                    response = requests.post(API_URL, json=data)
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Sent {data['sensor_type']}: {data['payload']} -> API Status: {response.status_code} | Risk: {response.json().get('risk_evaluation')}")
+                except Exception as e:
+                    print(f"Error sending to API: {e}")
                 
             # 2. Send to Azure IoT Hub (if connected)
             if azure_client:
+                from azure.iot.device import Message
                 msg = Message(json.dumps(data))
                 msg.content_encoding = "utf-8"
                 msg.content_type = "application/json"
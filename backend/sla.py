@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+# --- SLA Policies ---
+# Repair response targets by band, as reported on /analytics/sla-performance.
+# band -> (time allowed, target % met)
+SLA_BANDS = {
+    "Emergency": (timedelta(hours=24), 90),
+    "Urgent": (timedelta(hours=48), 85),
+    "Routine": (timedelta(days=7), 85),
+}
+
+BAND_LABELS = {
+    "Emergency": "Emergency (<24h)",
+    "Urgent": "Urgent (<48h)",
+    "Routine": "Routine (<7d)",
+}
+
+# Ticket priority -> SLA band
+PRIORITY_BANDS = {
+    "Emergency": "Emergency",
+    "High": "Urgent",
+    "Urgent": "Urgent",
+    "Medium": "Routine",
+    "Low": "Routine",
+    "Routine": "Routine",
+}
+
+RESOLVED_STATUSES = ("Resolved", "Closed")
+# Listed explicitly (rather than "not resolved") so scans can use the (status, sla_due) index
+OPEN_STATUSES = ("Open", "In Progress", "Awaiting Tenant")
+
+
+def band_for(priority: str | None) -> str:
+    return PRIORITY_BANDS.get(priority, "Routine")
+
+
+def sla_due_for(priority: str | None, created_at: datetime) -> datetime:
+    return created_at + SLA_BANDS[band_for(priority)][0]
+
+
+def sla_outcome(ticket) -> tuple[str, bool] | None:
+    """
+    (band, met) for a resolved ticket, or None if it doesn't count towards SLA stats yet.
+    """
+    if ticket.status not in RESOLVED_STATUSES or ticket.sla_met is None:
+        return None
+    return band_for(ticket.priority), bool(ticket.sla_met)
+
+
+def apply_sla(ticket, now: datetime, priority_changed: bool = False):
+    """
+    Brings a ticket's SLA fields in line with its priority and status.
+    Call after creating or editing a ticket, before committing.
+    """
+    if ticket.sla_due is None or priority_changed:
+        ticket.sla_due = sla_due_for(ticket.priority, ticket.created_at or now)
+        ticket.sla_alert = None  # New deadline: the breach scanner alerts on it afresh
+
+    if ticket.status in RESOLVED_STATUSES:
+        if ticket.resolved_at is None:
+            ticket.resolved_at = now
+        ticket.sla_met = ticket.resolved_at <= ticket.sla_due
+    else:
+        # Re-opened tickets are back on the clock
+        if ticket.resolved_at is not None:
+            ticket.sla_alert = None
+        ticket.resolved_at = None
+        ticket.sla_met = None
+
+    ticket.sla_breached = (ticket.resolved_at or now) > ticket.sla_due
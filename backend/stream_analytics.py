@@ -0,0 +1,244 @@
+import math
+import threading
+from datetime import datetime
+
+from shared_state import InMemoryState, SharedState
+
+# --- Streaming Trend Analytics ---
+# calculate_risk() only sees one reading. This module keeps a tiny amount of state
+# per sensor (a handful of floats per tracked metric) and updates it in O(1) on every
+# reading, so trends over hours can be spotted without re-reading history from the DB.
+#
+# The "windows" are time-based exponential windows: a reading's weight halves every
+# `half_life` seconds, which behaves like a sliding window of a few half-lives but
+# needs no buffer of past readings and copes with irregular cadence.
+#
+# The rate of change is the slope of a weighted least-squares line through the window
+# (value against time), not an average of reading-to-reading differences, which would
+# mostly measure noise. It only counts once it's statistically distinguishable from
+# zero, and a raised trend_risk has to hold for TREND_HOLD seconds before it's reported.
+
+# Metrics tracked per sensor type: payload key -> half-life of the window in seconds
+TRACKED_METRICS = {
+    "environmental": {"humidity": 3600, "temp": 3600, "co2": 1800},
+    "plumbing": {"pipe_temp": 3600},
+    "boiler": {"pressure": 6 * 3600},
+}
+
+MIN_SAMPLES = 5  # Don't judge a trend until we've seen a few readings
+ANOMALY_Z = 4.0  # Readings this many std devs away from the window mean are anomalous
+SLOPE_Z = 3.0  # A slope must be this many standard errors from zero to count as a trend
+TREND_HOLD = 15 * 60  # Seconds a raised trend_risk must persist before it's reported
+STATE_TTL = 24 * 3600  # Forget a sensor's windows after a day without readings
+
+
+class MetricWindow:
+    """
+    Exponentially weighted mean, variance and rate of change (units per hour)
+    for one metric of one sensor.
+    """
+    __slots__ = ("half_life", "mean", "var", "origin", "t_mean", "t_var", "cov",
+                 "weight", "weight_sq", "last_ts", "count")
+
+    def __init__(self, half_life: float):
+        self.half_life = half_life
+        self.mean = 0.0
+        self.var = 0.0
+        self.origin = None  # Time of the first reading; times are kept relative to it
+        self.t_mean = 0.0  # Weighted mean time of the readings in the window
+        self.t_var = 0.0
+        self.cov = 0.0  # Weighted covariance of time and value
+        self.weight = 0.0  # Sum of weights and of squared weights, for the effective sample size
+        self.weight_sq = 0.0
+        self.last_ts = None
+        self.count = 0
+
+    def update(self, value: float, ts: float) -> float:
+        """
+        Adds a reading and returns its z-score against the window *before* the update.
+        """
+        if self.count == 0:
+            self.mean = value
+            self.origin = self.last_ts = ts
+            self.weight = self.weight_sq = 1.0
+            self.count = 1
+            return 0.0
+
+        dt = ts - self.last_ts
+        if dt <= 0:
+            # Late or duplicate reading: it says nothing about the current trend
+            return 0.0
+
+        std = math.sqrt(self.var)
+        z = (value - self.mean) / std if std > 1e-9 else 0.0
+
+        decay = math.exp(-dt * math.log(2) / self.half_life)
+        self.weight = decay * self.weight + 1.0
+        self.weight_sq = decay * decay * self.weight_sq + 1.0
+        # The new reading's share of the total weight. Normalising by the weight so far
+        # (rather than using 1 - decay) keeps the first readings from being over-weighted.
+        alpha = 1.0 / self.weight
+        diff = value - self.mean
+        t_diff = (ts - self.origin) - self.t_mean
+        self.mean += alpha * diff
+        self.var = (1.0 - alpha) * (self.var + alpha * diff * diff)
+        self.t_mean += alpha * t_diff
+        self.t_var = (1.0 - alpha) * (self.t_var + alpha * t_diff * t_diff)
+        self.cov = (1.0 - alpha) * (self.cov + alpha * t_diff * diff)
+
+        self.last_ts = ts
+        self.count += 1
+        return z
+
+    @property
+    def slope(self) -> float:
+        """
+        Fitted rate of change per hour, or 0.0 while it can't be told apart from noise.
+        """
+        if self.count < MIN_SAMPLES or self.t_var <= 0:
+            return 0.0
+        slope = self.cov / self.t_var  # Per second
+        residual_var = max(self.var - slope * self.cov, 0.0)
+        effective_n = self.weight * self.weight / self.weight_sq
+        if effective_n <= 2:
+            return 0.0
+        std_err = math.sqrt(residual_var / ((effective_n - 2) * self.t_var))
+        if abs(slope) <= SLOPE_Z * std_err:
+            return 0.0
+        return slope * 3600.0
+
+    def to_state(self) -> list:
+        """Plain list of the window's numbers, for keeping it in shared state."""
+        return [self.mean, self.var, self.origin, self.t_mean, self.t_var, self.cov,
+                self.weight, self.weight_sq, self.last_ts, self.count]
+
+    @classmethod
+    def from_state(cls, half_life: float, state: list) -> "MetricWindow":
+        window = cls(half_life)
+        (window.mean, window.var, window.origin, window.t_mean, window.t_var, window.cov,
+         window.weight, window.weight_sq, window.last_ts, window.count) = state
+        return window
+
+    def projected(self, hours: float) -> float:
+        """Where the fitted line says the value will be `hours` after the last reading."""
+        now = (self.last_ts - self.origin - self.t_mean) / 3600.0 if self.count else 0.0
+        return self.mean + self.slope * (now + hours)
+
+    def snapshot(self) -> dict:
+        return {
+            "ewma": round(self.mean, 3),
+            "std": round(math.sqrt(self.var), 3),
+            "rate_per_hour": round(self.slope, 3),
+            "samples": self.count,
+        }
+
+
+def _trend_environmental(m: dict) -> str:
+    humidity, temp = m["humidity"], m["temp"]
+    # Humidity creeping towards the mould threshold in a cold room
+    if humidity.projected(6) > 70 and humidity.slope > 1 and temp.count and temp.mean < 18:
+        return "High"
+    if humidity.projected(6) > 70 and humidity.slope > 1:
+        return "Medium"
+    if m["co2"].projected(2) > 1000 and m["co2"].slope > 0:
+        return "Medium"
+    return "Low"
+
+
+def _trend_plumbing(m: dict) -> str:
+    pipe_temp = m["pipe_temp"]
+    # Pipe heading for freezing
+    if pipe_temp.slope < 0 and pipe_temp.projected(6) < 0:
+        return "High"
+    if pipe_temp.slope < 0 and pipe_temp.projected(6) < 4:
+        return "Medium"
+    return "Low"
+
+
+def _trend_boiler(m: dict) -> str:
+    pressure = m["pressure"]
+    # Slow leak in the heating circuit shows up as steadily falling pressure
+    if pressure.slope < 0 and pressure.projected(24) < 0.5:
+        return "High"
+    if pressure.slope < 0 and pressure.projected(24) < 1.0:
+        return "Medium"
+    return "Low"
+
+
+TREND_RULES = {
+    "environmental": _trend_environmental,
+    "plumbing": _trend_plumbing,
+    "boiler": _trend_boiler,
+}
+
+
+class TrendAnalyzer:
+    """
+    Runs readings through each sensor's windows. The windows (a few floats per metric)
+    live in the shared state backend, so with several workers every one of them builds
+    on the same history whichever worker a reading lands on.
+
+    Two workers updating the same sensor at the same moment both start from the same
+    stored state and the later write wins, dropping the other reading from the window.
+    Devices send one reading at a time, so in practice this needs a retried delivery
+    racing a new one; the queue consumer avoids it entirely (one partition per sensor).
+    """
+
+    def __init__(self, shared_state: SharedState | None = None):
+        self._state = shared_state or InMemoryState()
+        self._lock = threading.Lock()  # Serialises updates within this process
+
+    def update(self, sensor_id: str, sensor_type: str, payload: dict, timestamp: datetime) -> dict:
+        """
+        Feeds one reading in and returns {"trend_risk": ..., "metrics": {...}}.
+        """
+        tracked = TRACKED_METRICS.get(sensor_type)
+        if not tracked:
+            return {"trend_risk": "Low", "metrics": {}}
+
+        ts = timestamp.timestamp()
+        key = f"trend:{sensor_id}"
+        with self._lock:
+            # {"windows": {metric: MetricWindow.to_state()}, "raised_since": ts | None}
+            stored = self._state.cache_get(key) or {"windows": {}, "raised_since": None}
+            windows = {
+                name: MetricWindow.from_state(half_life, stored["windows"][name])
+                if name in stored["windows"] else MetricWindow(half_life)
+                for name, half_life in tracked.items()
+            }
+
+            anomalous = False
+            for name, window in windows.items():
+                value = payload.get(name)
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                z = window.update(float(value), ts)
+                if window.count > MIN_SAMPLES and abs(z) > ANOMALY_Z:
+                    anomalous = True
+
+            # Metrics a sensor never reports stay at count 0 and are left out
+            seen = [w.count for w in windows.values() if w.count]
+            ready = bool(seen) and min(seen) >= MIN_SAMPLES
+            risk = TREND_RULES[sensor_type](windows) if ready else "Low"
+            if anomalous and risk == "Low":
+                risk = "Medium"
+
+            # Hold back a raised risk until it has persisted for TREND_HOLD seconds, so a
+            # single noisy stretch doesn't flap the sensor's trend_risk
+            if risk == "Low":
+                raised_since = None
+            else:
+                raised_since = stored["raised_since"] if stored["raised_since"] is not None else ts
+                if ts - raised_since < TREND_HOLD:
+                    risk = "Low"
+
+            self._state.cache_set(key, {
+                "windows": {name: w.to_state() for name, w in windows.items()},
+                "raised_since": raised_since,
+            }, ttl=STATE_TTL)
+            metrics = {name: w.snapshot() for name, w in windows.items()}
+
+        return {"trend_risk": risk, "metrics": metrics}
+
+    def forget(self, sensor_id: str):
+        self._state.invalidate(f"trend:{sensor_id}")
@@ -0,0 +1,35 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The backend uses flat imports (`from main import ...`), so put it on the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# main.py reads these at import time: give the tests a throwaway database and
+# process-local shared state (stands in for Redis, see shared_state.py)
+_tmp = tempfile.mkdtemp(prefix="propsense-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/test.db"
+os.environ["SHARED_STATE_URL"] = "memory://"
+os.environ["AUTO_MIGRATE"] = "true"
+os.environ["SLA_SCAN_INTERVAL"] = "3600"  # Tests call scan_sla_breaches() themselves
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    import main
+
+    # Used as a context manager so the lifespan hook (schema setup) runs
+    with TestClient(main.app) as c:
+        yield c
+
+
+@pytest.fixture
+def db(client):
+    import main
+
+    session = main.SessionLocal()
+    yield session
+    session.close()
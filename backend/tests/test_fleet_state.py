@@ -0,0 +1,76 @@
+import json
+
+from fleet_state import FleetStateStore
+from shared_state import InMemoryState
+
+PROPERTIES = [{"property_id": 1, "address": "1 High Street", "tenant_name": "A"}]
+
+
+def _record(sensor_id, risk, sequence=None, epoch=None, property_id=1, timestamp=None):
+    return {"sensor_id": sensor_id, "property_id": property_id, "type": "boiler",
+            "payload": {}, "risk_level": risk, "timestamp": timestamp, "sequence": sequence, "epoch": epoch}
+
+
+def test_update_respects_epoch_and_sequence():
+    store = FleetStateStore(InMemoryState(), "updates")
+    assert store.update(_record("S-1", "Low", sequence=10, epoch=1))
+    assert not store.update(_record("S-1", "High", sequence=9, epoch=1))
+    assert store.update(_record("S-1", "High", sequence=1, epoch=2))
+    assert not store.update(_record("S-1", "Low", sequence=50, epoch=1))
+    assert json.loads(store.render_status(PROPERTIES))["risk_level"] == "High"
+
+
+def test_update_without_sequence_compares_timestamps():
+    store = FleetStateStore(InMemoryState(), "updates")
+    assert store.update(_record("S-1", "High", timestamp="2026-01-01T10:00:00"))
+    assert not store.update(_record("S-1", "Low", timestamp="2026-01-01T09:00:00"))
+    assert not store.update(_record("S-1", "Low", sequence=3, timestamp="2026-01-01T09:30:00"))
+    assert json.loads(store.render_status(PROPERTIES))["risk_level"] == "High"
+    assert store.update(_record("S-1", "Medium", timestamp="2026-01-01T10:00:01"))
+    assert json.loads(store.render_status(PROPERTIES))["risk_level"] == "Medium"
+
+
+def test_render_status_groups_by_property():
+    store = FleetStateStore(InMemoryState(), "updates")
+    store.update(_record("S-1", "Medium"))
+    store.update(_record("S-2", "Low"))
+    store.update(_record("S-3", "High", property_id=99))
+    status = json.loads(store.render_status(PROPERTIES))
+    by_id = {p["property_id"]: p for p in status["properties"]}
+    assert [s["sensor_id"] for s in by_id[1]["sensors"]] == ["S-1", "S-2"]
+    assert by_id[1]["risk_level"] == "Medium"
+    assert by_id[0]["address"] == "Unassigned Sensors" and by_id[0]["risk_level"] == "High"
+    assert status["risk_level"] == "High"
+
+
+def test_sync_follows_channel_and_polls_loader():
+    state = InMemoryState()
+    loaded = {"after": []}
+
+    def loader(after_id):
+        loaded["after"].append(after_id)
+        return ([_record("S-db", "Medium")], 7) if after_id == 0 else ([], after_id)
+
+    store = FleetStateStore(state, "updates", loader, poll_interval=0)
+    store.sync()
+    state.publish("updates", _record("S-ch", "Low"))
+    store.sync()
+    assert len(store) == 2
+    assert loaded["after"] == [0, 7]
+
+
+def test_loader_does_not_replace_the_same_reading():
+    state = InMemoryState()
+    from_db = [_record("S-1", "Low", sequence=4, epoch=1), _record("S-2", "Low", timestamp="2026-01-01T10:00:00")]
+
+    def loader(after_id):
+        return from_db, after_id + 1  # The DB keeps reporting the same latest rows
+
+    store = FleetStateStore(state, "updates", loader, poll_interval=0)
+    store.sync()
+    for record in from_db:
+        state.publish("updates", {**record, "trend_risk": "High"})
+    store.sync()
+    store.sync()  # Polls the loader again: its rows carry no trend_risk
+    sensors = json.loads(store.render_status(PROPERTIES))["properties"][0]["sensors"]
+    assert [s["trend_risk"] for s in sensors] == ["High", "High"]
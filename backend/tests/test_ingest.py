@@ -0,0 +1,112 @@
+import uuid
+
+import pytest
+
+
+@pytest.fixture
+def sensor_id():
+    return f"ENV-{uuid.uuid4().hex[:8]}"
+
+
+def _reading(sensor_id, sequence=None, **extra):
+    from main import SensorData
+
+    return SensorData(sensor_id=sensor_id, sensor_type="environmental", property_id=1,
+                      payload={"temp": 20, "humidity": 50}, sequence=sequence, **extra)
+
+
+def _stored(db, sensor_id):
+    from main import SensorReading
+
+    return db.query(SensorReading).filter(SensorReading.sensor_id == sensor_id).count()
+
+
+def test_duplicates_inside_a_batch(db, sensor_id):
+    from main import ingest_batch
+
+    results = ingest_batch([_reading(sensor_id, 1), _reading(sensor_id, 1), _reading(sensor_id, 2)])
+    assert [r.get("duplicate", False) for r in results] == [False, True, False]
+    assert _stored(db, sensor_id) == 2
+
+
+def test_duplicates_across_batches(db, sensor_id):
+    from main import ingest_batch
+
+    ingest_batch([_reading(sensor_id, 1)])
+    assert ingest_batch([_reading(sensor_id, 1)])[0]["duplicate"]
+    assert _stored(db, sensor_id) == 1
+
+
+def test_duplicate_caught_by_unique_index_after_lru_miss(db, sensor_id, monkeypatch):
+    import main
+
+    main.ingest_batch([_reading(sensor_id, 1)])
+    # Another worker, or a key that fell out of the LRU: only the DB knows about it
+    monkeypatch.setattr(main, "recent_keys", main.RecentKeys(10))
+    results = main.ingest_batch([_reading(sensor_id, 1), _reading(sensor_id, 2)])
+    assert [r.get("duplicate", False) for r in results] == [True, False]
+    assert _stored(db, sensor_id) == 2
+
+
+def test_idempotency_key(db, sensor_id):
+    from main import ingest_batch
+
+    key = uuid.uuid4().hex
+    ingest_batch([_reading(sensor_id, idempotency_key=key)])
+    assert ingest_batch([_reading(sensor_id, idempotency_key=key)])[0]["duplicate"]
+    assert _stored(db, sensor_id) == 1
+
+
+def test_readings_without_keys_are_never_deduplicated(db, sensor_id):
+    from main import ingest_batch
+
+    ingest_batch([_reading(sensor_id), _reading(sensor_id)])
+    assert _stored(db, sensor_id) == 2
+
+
+def test_post_sensor_data(client, sensor_id):
+    body = {"sensor_id": sensor_id, "sensor_type": "environmental", "property_id": 1,
+            "payload": {"temp": 12, "humidity": 85}, "sequence": 1}
+    first = client.post("/sensor-data", json=body).json()
+    assert first["risk_evaluation"] == "High"
+    assert client.post("/sensor-data", json=body).json()["duplicate"]
+
+
+def test_device_timestamps_are_kept(db, sensor_id):
+    from datetime import datetime, timedelta, timezone
+    from main import SensorReading, ingest_batch
+
+    # A backlog of queued readings, 8 seconds apart, ingested in one batch
+    start = datetime.now(timezone.utc) - timedelta(hours=1)
+    batch = [_reading(sensor_id, n, timestamp=start + timedelta(seconds=8 * n)) for n in range(20)]
+    results = ingest_batch(batch)
+
+    stored = [r.timestamp for r in db.query(SensorReading).filter(SensorReading.sensor_id == sensor_id)]
+    assert len(set(stored)) == 20
+    assert min(stored) == start.astimezone().replace(tzinfo=None)
+    assert results[-1]["trend_metrics"]["humidity"]["samples"] == 20
+
+
+def test_missing_or_future_timestamp_falls_back_to_receive_time(db, sensor_id):
+    from datetime import datetime, timedelta
+    from main import SensorReading, ingest_batch
+
+    before = datetime.now()
+    ingest_batch([_reading(sensor_id, 1), _reading(sensor_id, 2, timestamp=before + timedelta(days=1))])
+    stored = [r.timestamp for r in db.query(SensorReading).filter(SensorReading.sensor_id == sensor_id)]
+    assert all(before <= ts <= datetime.now() for ts in stored)
+
+
+def test_sequence_reset_with_new_epoch_is_not_a_duplicate(db, sensor_id):
+    import main
+
+    main.ingest_batch([_reading(sensor_id, n, epoch=1000) for n in (1, 2, 3)])
+    # Reboot: the counter starts again, under a new epoch
+    results = main.ingest_batch([_reading(sensor_id, 1, epoch=2000)])
+    assert not results[0].get("duplicate")
+    assert _stored(db, sensor_id) == 4
+    latest = main.shared_state.get_latest(sensor_id)
+    assert (latest["epoch"], latest["sequence"]) == (2000, 1)
+
+    # Redelivery of a pre-reboot reading is still a duplicate
+    assert main.ingest_batch([_reading(sensor_id, 2, epoch=1000)])[0]["duplicate"]
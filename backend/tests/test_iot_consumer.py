@@ -0,0 +1,87 @@
+import json
+import threading
+import time
+import uuid
+
+from message_queue import FileQueue, InProcessQueue
+
+
+def _run_until(queue, stop_when, dead_letter_path, timeout=5.0):
+    from iot_consumer import consume_partition
+
+    stop = threading.Event()
+    stats = {"ingested": 0, "duplicates": 0, "dead_lettered": 0, "lock": threading.Lock()}
+    thread = threading.Thread(target=consume_partition,
+                              args=(queue, 0, stop, 500, stats, str(dead_letter_path)))
+    thread.start()
+    deadline = time.monotonic() + timeout
+    while not stop_when(stats) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    stop.set()
+    thread.join()
+    return stats
+
+
+def _reading(sensor_id, sequence, payload):
+    return {"sensor_id": sensor_id, "sensor_type": "environmental", "property_id": 1,
+            "payload": payload, "sequence": sequence}
+
+
+def test_bad_reading_is_dead_lettered_and_partition_keeps_moving(client, tmp_path):
+    sensor_id = f"ENV-{uuid.uuid4().hex[:8]}"
+    queue = InProcessQueue(partitions=1)
+    queue.send(_reading(sensor_id, 1, {"temp": "cold", "humidity": 90}))  # calculate_risk raises
+    queue.send(_reading(sensor_id, 2, {"temp": 20, "humidity": 50}))
+    queue.send({"sensor_id": sensor_id, "payload": "not a reading"})  # Fails validation
+
+    dead_letters = tmp_path / "dead.jsonl"
+    stats = _run_until(queue, lambda s: s["ingested"] + s["dead_lettered"] >= 3, dead_letters)
+
+    assert stats["ingested"] == 1
+    assert stats["dead_lettered"] == 2
+    assert queue.receive(0, timeout=0) == []  # Everything acked, nothing to redeliver
+    offsets = [json.loads(line)["offset"] for line in dead_letters.read_text().splitlines()]
+    assert sorted(offsets) == [1, 3]
+
+
+def test_corrupt_queue_line_is_dead_lettered(client, tmp_path):
+    sensor_id = f"ENV-{uuid.uuid4().hex[:8]}"
+    queue = FileQueue(str(tmp_path / "queue"), partitions=1, poll_interval=0.01)
+    with open(tmp_path / "queue" / "partition-0.log", "ab") as f:
+        f.write(b"\xff{not json\n")
+    queue.send(_reading(sensor_id, 1, {"temp": 20, "humidity": 50}))
+
+    dead_letters = tmp_path / "dead.jsonl"
+    stats = _run_until(queue, lambda s: s["ingested"] + s["dead_lettered"] >= 2, dead_letters)
+
+    assert stats["ingested"] == 1
+    assert stats["dead_lettered"] == 1
+    [entry] = [json.loads(line) for line in dead_letters.read_text().splitlines()]
+    assert entry["body"] == {"raw": "\ufffd{not json"}
+    assert entry["error"].startswith("UnicodeDecodeError")
+
+
+def test_transient_errors_retry_the_whole_batch(client, tmp_path, monkeypatch):
+    import iot_consumer
+    from sqlalchemy.exc import OperationalError
+
+    real_ingest = iot_consumer.ingest_batch
+    calls = []
+
+    def flaky(batch):
+        calls.append(len(batch))
+        if len(calls) == 1:
+            raise OperationalError("INSERT", {}, Exception("database is locked"))
+        return real_ingest(batch)
+
+    monkeypatch.setattr(iot_consumer, "ingest_batch", flaky)
+    monkeypatch.setattr(iot_consumer, "RETRY_DELAY", 0.01)
+    sensor_id = f"ENV-{uuid.uuid4().hex[:8]}"
+    queue = InProcessQueue(partitions=1)
+    for sequence in (1, 2):
+        queue.send(_reading(sensor_id, sequence, {"temp": 20, "humidity": 50}))
+
+    stats = _run_until(queue, lambda s: s["ingested"] >= 2, tmp_path / "dead.jsonl")
+    assert stats["ingested"] == 2
+    assert stats["dead_lettered"] == 0
+    assert calls == [2, 2]  # Retried as a batch, not split up
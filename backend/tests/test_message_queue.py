@@ -0,0 +1,63 @@
+from message_queue import FileQueue, InProcessQueue, partition_for
+
+
+def _single_partition_messages(queue, count):
+    for n in range(count):
+        queue.send({"sensor_id": "S-1", "n": n})
+    return partition_for("S-1", queue.partitions)
+
+
+def test_file_queue_ack_and_restart(tmp_path):
+    queue = FileQueue(str(tmp_path), partitions=2, poll_interval=0.01)
+    p = _single_partition_messages(queue, 5)
+
+    first = queue.receive(p, max_messages=3, timeout=0)
+    assert [m.body["n"] for m in first] == [0, 1, 2]
+    queue.ack(p, first)
+
+    # A new consumer (e.g. after a crash) resumes after the last ack
+    restarted = FileQueue(str(tmp_path), partitions=2, poll_interval=0.01)
+    rest = restarted.receive(p, timeout=0)
+    assert [m.body["n"] for m in rest] == [3, 4]
+
+
+def test_file_queue_release_redelivers(tmp_path):
+    queue = FileQueue(str(tmp_path), partitions=2, poll_interval=0.01)
+    p = _single_partition_messages(queue, 3)
+
+    batch = queue.receive(p, timeout=0)
+    queue.release(p, batch)
+    again = queue.receive(p, timeout=0)
+    assert [m.body["n"] for m in again] == [0, 1, 2]
+
+    queue.ack(p, again)
+    assert queue.receive(p, timeout=0) == []
+
+
+def test_file_queue_unacked_messages_survive_restart(tmp_path):
+    queue = FileQueue(str(tmp_path), partitions=1, poll_interval=0.01)
+    _single_partition_messages(queue, 2)
+    assert len(queue.receive(0, timeout=0)) == 2  # Received, never acked
+
+    restarted = FileQueue(str(tmp_path), partitions=1, poll_interval=0.01)
+    assert [m.body["n"] for m in restarted.receive(0, timeout=0)] == [0, 1]
+
+
+def test_file_queue_returns_corrupt_lines_with_error(tmp_path):
+    queue = FileQueue(str(tmp_path), partitions=1, poll_interval=0.01)
+    queue.send({"n": 0})
+    with open(tmp_path / "partition-0.log", "ab") as f:
+        f.write(b'{"n": 1, trunc\n')
+    queue.send({"n": 2})
+
+    messages = queue.receive(0, timeout=0)
+    assert [m.body for m in messages] == [{"n": 0}, {"raw": '{"n": 1, trunc'}, {"n": 2}]
+    assert [m.error is not None for m in messages] == [False, True, False]
+
+
+def test_in_process_queue_release_keeps_order():
+    queue = InProcessQueue(partitions=1)
+    _single_partition_messages(queue, 4)
+    first = queue.receive(0, max_messages=2, timeout=0)
+    queue.release(0, first)
+    assert [m.body["n"] for m in queue.receive(0, timeout=0)] == [0, 1, 2, 3]
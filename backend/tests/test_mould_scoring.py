@@ -0,0 +1,88 @@
+import json
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from mould_scoring import PropertyFeatures, extract_features, partition_properties, run
+
+START = datetime(2026, 1, 1)
+
+
+def _series(hours=48, step=600):
+    # Dry, then a damp spell from 10h to 40h, then dry again
+    ts = np.arange(0, hours * 3600, step, dtype=float)
+    humidity = np.where((ts >= 10 * 3600) & (ts < 40 * 3600), 85.0, 55.0)
+    temp = np.where(ts < 24 * 3600, 16.0, 20.0)
+    return ts, temp, humidity
+
+
+def _features(chunks):
+    acc = PropertyFeatures()
+    for ts, temp, humidity in chunks:
+        acc.update(ts, temp, humidity)
+    return acc
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 100, 60, 10000])
+def test_features_do_not_depend_on_chunk_size(chunk_size):
+    ts, temp, humidity = _series()
+    whole = _features([(ts, temp, humidity)])
+    # chunk_size=60 puts a boundary at 10h, 100 one in the middle of the damp spell
+    bounds = range(chunk_size, len(ts), chunk_size)
+    chunked = _features(zip(np.split(ts, bounds), np.split(temp, bounds), np.split(humidity, bounds)))
+    assert np.allclose(chunked.vector(), whole.vector())
+    assert chunked.readings == whole.readings == len(ts)
+    assert chunked.longest_damp == pytest.approx(30.0)
+
+
+def test_partition_properties():
+    assert partition_properties([], 4) == []
+    assert partition_properties([7, 3, 5], 8) == [(3, 3), (5, 5), (7, 7)]
+    assert partition_properties(list(range(1, 11)), 3) == [(1, 4), (5, 7), (8, 10)]
+    assert partition_properties([2, 1], 0) == [(1, 2)]
+
+
+def _add_readings(db, property_id, series):
+    import main
+
+    for t, temp, humidity in zip(*series):
+        db.add(main.SensorReading(property_id=property_id, sensor_id=f"ENV-{property_id}",
+                                  sensor_type="environmental", risk_level="Low",
+                                  payload=json.dumps({"temp": temp, "humidity": humidity}),
+                                  timestamp=START + timedelta(seconds=t)))
+    db.commit()
+
+
+def test_extract_features_streams_in_any_chunk_size(db):
+    import main
+
+    _add_readings(db, 9001, _series())
+    _add_readings(db, 9002, _series(hours=12, step=900))
+    # A reading without a timestamp (legacy row) is skipped, not fatal
+    db.execute(main.SensorReading.__table__.insert().values(
+        property_id=9001, sensor_id="ENV-9001", sensor_type="environmental",
+        payload=json.dumps({"temp": 20, "humidity": 50}), timestamp=None,
+    ))
+    db.commit()
+
+    results = [extract_features((9001, 9002), chunk_size) for chunk_size in (1, 50, 10000)]
+    for result in results[1:]:
+        assert result.keys() == results[0].keys() == {9001, 9002}
+        for pid, (vector, readings) in result.items():
+            assert np.allclose(vector, results[0][pid][0])
+            assert readings == results[0][pid][1]
+    assert results[0][9001][1] == len(_series()[0])
+
+
+def test_run_writes_scores(db):
+    import main
+
+    _add_readings(db, 9003, _series())
+    assert run(workers=1) >= 1
+    db.expire_all()
+    row = db.get(main.MouldRiskScore, 9003)
+    assert 0.0 <= row.score <= 1.0
+    assert row.risk_level in ("Low", "Medium", "High")
+    assert row.readings_used == len(_series()[0])
+    assert json.loads(row.features)["damp_fraction"] == pytest.approx(30 / 48, abs=0.01)
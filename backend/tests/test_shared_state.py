@@ -0,0 +1,97 @@
+import pytest
+
+from shared_state import InMemoryState, SQLiteState
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def state(request, tmp_path):
+    # Every backend has to behave the same, so each test runs against all of them
+    if request.param == "memory":
+        s = InMemoryState(retention=50)
+    else:
+        s = SQLiteState(str(tmp_path / "shared.db"), retention=50)
+    yield s
+    s.close()
+
+
+def test_cache_set_get_invalidate(state):
+    state.cache_set("k", {"a": 1})
+    assert state.cache_get("k") == {"a": 1}
+    state.invalidate("k")
+    assert state.cache_get("k") is None
+
+
+def test_cache_ttl_expires(state, monkeypatch):
+    import shared_state
+
+    state.cache_set("k", [1, 2], ttl=10)
+    now = shared_state.time.time()
+    monkeypatch.setattr(shared_state.time, "time", lambda: now + 11)
+    assert state.cache_get("k") is None
+
+
+def test_set_latest_never_moves_backwards(state):
+    assert state.set_latest("S-1", {"sequence": 5, "v": "five"})
+    assert not state.set_latest("S-1", {"sequence": 3, "v": "three"})
+    assert state.get_latest("S-1")["v"] == "five"
+    # Same sequence again (a redelivery) is allowed through
+    assert state.set_latest("S-1", {"sequence": 5, "v": "again"})
+    assert state.set_latest("S-1", {"sequence": 6, "v": "six"})
+    assert state.all_latest() == {"S-1": {"sequence": 6, "v": "six"}}
+
+
+def test_set_latest_without_sequence_falls_back_to_timestamp(state):
+    state.set_latest("S-1", {"sequence": 5, "timestamp": "2026-01-01T10:00:00"})
+    assert not state.set_latest("S-1", {"sequence": None, "timestamp": "2026-01-01T09:59:59.5"})
+    assert state.set_latest("S-1", {"sequence": None, "timestamp": "2026-01-01T10:00:00.25", "v": 1})
+    # Sequence-less record held: a late sequenced reading is ordered by time too
+    assert not state.set_latest("S-1", {"sequence": 9, "timestamp": "2026-01-01T10:00:00"})
+    assert state.set_latest("S-1", {"sequence": 9, "timestamp": "2026-01-01T10:00:01", "v": 2})
+    assert state.get_latest("S-1")["v"] == 2
+    # Nothing to compare on: applies
+    assert state.set_latest("S-1", {"sequence": None, "v": 3})
+
+
+def test_read_since(state):
+    ids = [state.publish("updates", {"n": n}) for n in range(10)]
+    state.publish("other", {"n": -1})
+    assert ids == sorted(ids)
+    assert state.last_event_id("updates") == ids[-1]
+
+    events = state.read_since("updates", 0, limit=4)
+    assert [m["n"] for _, m in events] == [0, 1, 2, 3]
+    events = state.read_since("updates", events[-1][0], limit=100)
+    assert [m["n"] for _, m in events] == list(range(4, 10))
+    assert state.read_since("updates", ids[-1]) == []
+
+
+def test_busy_channel_does_not_make_others_look_behind(state):
+    first = state.publish("ticket-changes", {"n": 1})
+    for n in range(600):
+        state.publish("sensor-updates", {"n": n})
+    second = state.publish("ticket-changes", {"n": 2})
+    assert second == first + 1
+    assert not state.missed_events("ticket-changes", first)
+    assert state.read_since("ticket-changes", first) == [(second, {"n": 2})]
+
+
+def test_events_are_trimmed_per_channel(state):
+    for n in range(1000):
+        state.publish("updates", {"n": n})
+    events = state.read_since("updates", 0, limit=1000)
+    # SQLite trims every 500 events, so it may briefly hold more than the retention
+    assert len(events) >= 50 and events[-1] == (1000, {"n": 999})
+    assert events[0][0] > 1000 - 500
+    assert state.missed_events("updates", 900) and not state.missed_events("updates", 950)
+
+
+def test_set_latest_new_epoch_restarts_sequence(state):
+    state.set_latest("S-1", {"epoch": 100, "sequence": 900})
+    # Device rebooted: counter back to 1, but in a newer epoch
+    assert state.set_latest("S-1", {"epoch": 200, "sequence": 1, "v": "rebooted"})
+    assert state.get_latest("S-1")["v"] == "rebooted"
+    # A late reading from before the reboot doesn't win, whatever its sequence
+    assert not state.set_latest("S-1", {"epoch": 100, "sequence": 901})
+    # Devices that never sent an epoch are epoch 0
+    assert state.set_latest("S-2", {"sequence": 5})
+    assert state.set_latest("S-2", {"epoch": 1, "sequence": 1})
@@ -0,0 +1,155 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+
+def _counts(db):
+    from main import SlaStats
+
+    db.expire_all()
+    return {s.band: (s.met, s.breached) for s in db.query(SlaStats).all()}
+
+
+def _delta(before, after, band):
+    return (after[band][0] - before[band][0], after[band][1] - before[band][1])
+
+
+@pytest.fixture
+def ticket(client):
+    body = {"user_id": 1, "title": "Boiler not firing", "description": "No heating",
+            "priority": "High", "category": "Boiler"}
+    return client.post("/tickets", json=body).json()
+
+
+def test_resolve_counts_as_met(client, db, ticket):
+    before = _counts(db)
+    client.patch(f"/tickets/{ticket['id']}", params={"status": "Resolved"})
+    assert _delta(before, _counts(db), "Urgent") == (1, 0)
+
+
+def test_reopen_and_delete_undo_the_outcome(client, db, ticket):
+    before = _counts(db)
+    client.patch(f"/tickets/{ticket['id']}", params={"status": "Resolved"})
+    client.patch(f"/tickets/{ticket['id']}", params={"status": "Open"})
+    assert _delta(before, _counts(db), "Urgent") == (0, 0)
+
+    client.patch(f"/tickets/{ticket['id']}", params={"status": "Closed"})
+    client.delete(f"/tickets/{ticket['id']}")
+    assert _delta(before, _counts(db), "Urgent") == (0, 0)
+
+
+def test_late_resolution_counts_as_breached(client, db, ticket):
+    from main import Ticket
+
+    row = db.get(Ticket, ticket["id"])
+    row.created_at = datetime.utcnow() - timedelta(hours=72)
+    db.commit()
+    # Re-apply the SLA from the back-dated creation time
+    client.put(f"/tickets/{ticket['id']}", json={"priority": "Emergency"})
+
+    before = _counts(db)
+    client.patch(f"/tickets/{ticket['id']}", params={"status": "Resolved"})
+    assert _delta(before, _counts(db), "Emergency") == (0, 1)
+
+
+def test_priority_change_moves_band(client, db, ticket):
+    client.patch(f"/tickets/{ticket['id']}", params={"status": "Resolved"})
+    before = _counts(db)
+    client.put(f"/tickets/{ticket['id']}", json={"priority": "Low"})
+    after = _counts(db)
+    assert _delta(before, after, "Urgent") == (-1, 0)
+    assert _delta(before, after, "Routine") == (1, 0)
+
+
+def test_rebuild_matches_incremental_counts(client, db, ticket):
+    from main import rebuild_sla_stats
+
+    client.patch(f"/tickets/{ticket['id']}", params={"status": "Resolved"})
+    incremental = _counts(db)
+    rebuild_sla_stats(db)
+    assert _counts(db) == incremental
+
+
+def _alerts_for(ticket_id, after_id):
+    from main import SLA_ALERTS_CHANNEL, shared_state
+
+    events = shared_state.read_since(SLA_ALERTS_CHANNEL, after_id, limit=1000)
+    return [m["event"] for _, m in events if m["ticket_id"] == ticket_id]
+
+
+def _last_alert_id():
+    from main import SLA_ALERTS_CHANNEL, shared_state
+
+    return shared_state.last_event_id(SLA_ALERTS_CHANNEL)
+
+
+def test_ticket_escalated_past_its_deadline_gets_one_breach_alert(client, db, ticket):
+    from main import Ticket, scan_sla_breaches
+
+    row = db.get(Ticket, ticket["id"])
+    row.created_at = datetime.utcnow() - timedelta(hours=30)
+    db.commit()
+    # Escalating to Emergency puts the due time 6h in the past; apply_sla marks it breached
+    updated = client.put(f"/tickets/{ticket['id']}", json={"priority": "Emergency"}).json()
+    assert updated["sla_breached"]
+
+    start = _last_alert_id()
+    scan_sla_breaches()
+    scan_sla_breaches()
+    assert _alerts_for(ticket["id"], start) == ["breached"]
+
+
+def test_due_soon_then_breached(client, db, ticket):
+    from main import Ticket, scan_sla_breaches
+
+    row = db.get(Ticket, ticket["id"])
+    row.sla_due = datetime.utcnow() + timedelta(hours=1)
+    db.commit()
+    start = _last_alert_id()
+    scan_sla_breaches()
+    scan_sla_breaches()
+
+    row.sla_due = datetime.utcnow() - timedelta(minutes=1)  # Time passes
+    db.commit()
+    scan_sla_breaches()
+    assert _alerts_for(ticket["id"], start) == ["due_soon", "breached"]
+
+
+def test_reopened_ticket_is_alerted_again(client, db, ticket):
+    from main import Ticket, scan_sla_breaches
+
+    row = db.get(Ticket, ticket["id"])
+    row.sla_due = datetime.utcnow() - timedelta(hours=1)
+    db.commit()
+    start = _last_alert_id()
+    scan_sla_breaches()
+    client.patch(f"/tickets/{ticket['id']}", params={"status": "Resolved"})
+    client.patch(f"/tickets/{ticket['id']}", params={"status": "Open"})
+    scan_sla_breaches()
+    assert _alerts_for(ticket["id"], start) == ["breached", "breached"]
+
+
+def test_overlapping_scans_publish_each_alert_once(client, db, ticket):
+    from sqlalchemy import event
+
+    import main
+
+    row = db.get(main.Ticket, ticket["id"])
+    row.sla_due = datetime.utcnow() - timedelta(hours=1)
+    db.commit()
+    raced = []
+
+    def other_worker(conn, cursor, statement, *args):
+        # Another worker runs a whole scan between our read and our write
+        if statement.startswith("UPDATE tickets") and not raced:
+            raced.append(True)
+            main.scan_sla_breaches()
+
+    start = _last_alert_id()
+    event.listen(main.engine, "before_cursor_execute", other_worker)
+    try:
+        main.scan_sla_breaches()
+    finally:
+        event.remove(main.engine, "before_cursor_execute", other_worker)
+    assert raced
+    assert _alerts_for(ticket["id"], start) == ["breached"]
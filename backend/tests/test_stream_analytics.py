@@ -0,0 +1,95 @@
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from stream_analytics import TREND_HOLD, MetricWindow, TrendAnalyzer
+
+START = datetime(2026, 1, 1)
+
+
+def _feed(analyzer, sensor_type, payloads, cadence=8):
+    return [
+        analyzer.update("S-1", sensor_type, payload, START + timedelta(seconds=cadence * i))
+        for i, payload in enumerate(payloads)
+    ]
+
+
+def test_slope_matches_weighted_least_squares():
+    rng = random.Random(0)
+    window = MetricWindow(3600)
+    ts = np.arange(0, 4 * 3600, 8.0)
+    values = 50 + 2.0 * ts / 3600 + np.array([rng.gauss(0, 3) for _ in ts])
+    for t, v in zip(ts, values):
+        window.update(float(v), float(t))
+
+    weights = 0.5 ** ((ts[-1] - ts) / 3600)
+    slope = np.polyfit(ts / 3600, values, 1, w=np.sqrt(weights))[0]
+    assert abs(window.slope - slope) < 1e-6
+    assert abs(window.slope - 2.0) < 0.5
+
+
+def test_noisy_flat_data_is_not_a_trend():
+    # Same shape as sim.py's environmental sensor: mostly normal, with damp/cold spells
+    rng = random.Random(1)
+    payloads = []
+    for _ in range(2000):
+        damp = rng.random() < 0.2
+        payloads.append({
+            "temp": rng.uniform(10, 17) if damp else rng.uniform(18, 25),
+            "humidity": rng.uniform(70, 95) if damp else rng.uniform(40, 60),
+            "co2": rng.uniform(800, 1500) if damp else rng.uniform(400, 600),
+        })
+    results = _feed(TrendAnalyzer(), "environmental", payloads)
+    assert {r["trend_risk"] for r in results} == {"Low"}
+    assert results[-1]["metrics"]["humidity"]["rate_per_hour"] == 0.0
+
+
+def test_rising_humidity_in_cold_room_is_flagged_after_hold():
+    rng = random.Random(2)
+    payloads = [{"temp": 16, "humidity": 55 + 3 * (i * 8 / 3600) + rng.gauss(0, 2)} for i in range(3 * 450)]
+    results = _feed(TrendAnalyzer(), "environmental", payloads)
+    raised = [i for i, r in enumerate(results) if r["trend_risk"] != "Low"]
+    assert raised and results[-1]["trend_risk"] == "High"
+    assert results[-1]["metrics"]["humidity"]["rate_per_hour"] > 2
+    # Never raised before the condition could have held for TREND_HOLD
+    assert raised[0] * 8 >= TREND_HOLD
+
+
+def test_falling_boiler_pressure():
+    rng = random.Random(3)
+    payloads = [{"pressure": 1.5 - 0.05 * (i * 8 / 3600) + rng.gauss(0, 0.02)} for i in range(6 * 450)]
+    assert _feed(TrendAnalyzer(), "boiler", payloads)[-1]["trend_risk"] == "High"
+
+
+def test_short_spike_does_not_raise_trend_risk():
+    payloads = [{"pipe_temp": 12.0 + 0.1 * (i % 3)} for i in range(300)]
+    payloads[200] = {"pipe_temp": -5.0}  # One bad reading: anomalous, but over in 8 seconds
+    results = _feed(TrendAnalyzer(), "plumbing", payloads)
+    assert {r["trend_risk"] for r in results} == {"Low"}
+
+
+def test_late_readings_are_ignored():
+    window = MetricWindow(3600)
+    window.update(10.0, 100.0)
+    window.update(11.0, 108.0)
+    assert window.update(500.0, 50.0) == 0.0
+    assert window.count == 2
+
+
+def test_workers_sharing_state_agree_with_a_single_process(tmp_path):
+    from shared_state import SQLiteState
+
+    rng = random.Random(4)
+    payloads = [{"pressure": 1.5 - 0.05 * (i * 8 / 3600) + rng.gauss(0, 0.02)} for i in range(2000)]
+    single = _feed(TrendAnalyzer(), "boiler", payloads)
+
+    # Two "workers" with their own analyzer and connection, readings alternating between them
+    path = str(tmp_path / "shared.db")
+    workers = [TrendAnalyzer(SQLiteState(path)), TrendAnalyzer(SQLiteState(path))]
+    shared = [
+        workers[i % 2].update("S-1", "boiler", payload, START + timedelta(seconds=8 * i))
+        for i, payload in enumerate(payloads)
+    ]
+    assert [r["trend_risk"] for r in shared] == [r["trend_risk"] for r in single]
+    assert shared[-1]["metrics"] == single[-1]["metrics"]
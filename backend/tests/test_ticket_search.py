@@ -0,0 +1,125 @@
+import pytest
+
+from shared_state import InMemoryState
+from ticket_search import InvertedIndex, SqliteFtsIndex, tokenize
+
+TICKETS = [
+    ("Damp patch in bedroom", "Black mould spreading above the window", "Open", "Damp"),
+    ("Boiler pressure dropping", "Pressure falls to 0.5 bar overnight", "Open", "Boiler"),
+    ("Leak under kitchen sink", "Water pooling, possible damp in cupboard", "In Progress", "Plumbing"),
+    ("Dampness in hallway", "Walls feel wet", "Resolved", "Damp"),
+    ("Broken lift", "Lift stuck on floor 3", "Open", "Other"),
+]
+
+
+@pytest.fixture
+def indexes(tmp_path):
+    """A fresh database with TICKETS in it, and both index types built over it."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from main import Base, Ticket
+
+    engine = create_engine(f"sqlite:///{tmp_path}/search.db")
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+    db = session_factory()
+    for title, description, status, category in TICKETS:
+        db.add(Ticket(user_id=1, title=title, description=description, status=status,
+                      category=category, priority="Medium"))
+    db.commit()
+    db.close()
+    fts = SqliteFtsIndex(engine)
+    fts.migrate()
+    yield fts, InvertedIndex(session_factory, Ticket, InMemoryState())
+    engine.dispose()
+
+
+def _ids(hits):
+    return [ticket_id for ticket_id, _ in hits]
+
+
+def test_tokenize():
+    assert tokenize("Damp, MOULD & leak's") == ["damp", "mould", "leak", "s"]
+    assert tokenize(None) == []
+
+
+@pytest.mark.parametrize("query, filters", [
+    ("damp", {}),
+    ("damp", {"status": "Open"}),
+    ("pressure", {}),
+    ("lift stuck", {}),
+    ("dam", {"category": "Damp"}),
+    ("nothing matches this", {}),
+])
+def test_fts_and_inverted_index_agree(indexes, query, filters):
+    fts, inverted = indexes
+    assert set(_ids(fts.search(query, **filters))) == set(_ids(inverted.search(query, **filters)))
+
+
+def test_prefix_match_and_title_ranks_first(indexes):
+    for index in indexes:
+        hits = _ids(index.search("damp"))
+        # "dampness" matches as a prefix; title matches outrank the description-only one
+        assert set(hits) == {1, 3, 4}
+        assert hits[-1] == 3
+
+
+def test_all_words_must_match(indexes):
+    for index in indexes:
+        assert _ids(index.search("damp kitchen")) == [3]
+
+
+def test_inverted_index_rebuilds_when_channel_was_trimmed(tmp_path):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from main import Base, Ticket
+
+    engine = create_engine(f"sqlite:///{tmp_path}/trimmed.db")
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+    state = InMemoryState(retention=5)
+    index = InvertedIndex(session_factory, Ticket, state)
+    index.warm_up()  # Loaded before the changes below, so it has to catch up
+
+    db = session_factory()
+    for n in range(10):
+        ticket = Ticket(user_id=1, title=f"Damp patch {n}", description="", status="Open",
+                        category="Damp", priority="Medium")
+        db.add(ticket)
+        db.commit()
+        index.ticket_changed(ticket.id)  # Only the last 5 of these stay in the channel
+    db.close()
+
+    assert len(index.search("damp")) == 10
+    engine.dispose()
+
+
+def test_indexes_do_no_work_until_used(tmp_path):
+    from sqlalchemy import create_engine, inspect
+    from sqlalchemy.orm import sessionmaker
+    from main import Base, Ticket
+    from ticket_search import create_ticket_index
+
+    # A fresh database nobody has migrated yet: building the index objects must not touch it
+    engine = create_engine(f"sqlite:///{tmp_path}/fresh.db")
+    session_factory = sessionmaker(bind=engine)
+    fts = create_ticket_index(engine, session_factory, Ticket, InMemoryState())
+    inverted = InvertedIndex(session_factory, Ticket, InMemoryState())
+    assert inspect(engine).get_table_names() == []
+
+    Base.metadata.create_all(bind=engine)
+    fts.migrate()
+    db = session_factory()
+    db.add(Ticket(user_id=1, title="Damp patch", description="", status="Open", category="Damp", priority="Low"))
+    db.commit()
+    db.close()
+    assert len(fts.search("damp")) == len(inverted.search("damp")) == 1
+    engine.dispose()
+
+
+def test_missed_events():
+    state = InMemoryState(retention=5)
+    for n in range(8):
+        state.publish("changes", {"n": n})
+    assert state.missed_events("changes", 2)
+    assert not state.missed_events("changes", 3)
@@ -0,0 +1,275 @@
+import math
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter
+
+from sqlalchemy import text
+
+# --- Ticket Full-Text Search ---
+# Two interchangeable indexes over ticket title + description:
+#   SqliteFtsIndex  - SQLite FTS5 table kept in sync by triggers, so every worker
+#                     sees every change with no extra work (used for local dev).
+#   InvertedIndex   - in-process BM25 index for other databases (e.g. Azure SQL).
+#                     Changes are broadcast through the shared state backend so
+#                     each worker's copy stays in sync.
+# Both match query words as prefixes ("damp" finds "dampness") and rank title
+# matches above description matches.
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+TITLE_WEIGHT = 3.0
+TICKET_CHANGES_CHANNEL = "ticket-changes"
+
+
+def tokenize(value: str | None) -> list[str]:
+    return TOKEN_RE.findall(value.lower()) if value else []
+
+
+class TicketIndex:
+    def search(self, query: str, status: str | None = None, category: str | None = None,
+               priority: str | None = None, limit: int = 50) -> list[tuple[int, float]]:
+        """Returns (ticket_id, score) pairs, best match first. Higher score is better."""
+        raise NotImplementedError
+
+    def ticket_changed(self, ticket_id: int):
+        """Call after a ticket is created, updated or deleted."""
+        pass
+
+    def migrate(self):
+        """Creates anything the index keeps in the database. Called from init_db()."""
+        pass
+
+    def warm_up(self):
+        """Loads whatever the first search would otherwise have to wait for."""
+        pass
+
+    def rebuild(self):
+        raise NotImplementedError
+
+
+class SqliteFtsIndex(TicketIndex):
+    def __init__(self, engine):
+        self._engine = engine
+
+    def migrate(self):
+        self._create()
+
+    def _create(self) -> bool:
+        with self._engine.begin() as conn:
+            exists = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tickets_fts'"
+            )).first()
+            conn.execute(text("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS tickets_fts USING fts5(
+                    title, description, content='tickets', content_rowid='id',
+                    tokenize='porter unicode61'
+                )
+            """))
+            # Triggers belong to the tickets table, so they're re-created if it's dropped
+            conn.execute(text("""
+                CREATE TRIGGER IF NOT EXISTS tickets_fts_ai AFTER INSERT ON tickets BEGIN
+                    INSERT INTO tickets_fts (rowid, title, description)
+                    VALUES (new.id, new.title, new.description);
+                END
+            """))
+            conn.execute(text("""
+                CREATE TRIGGER IF NOT EXISTS tickets_fts_ad AFTER DELETE ON tickets BEGIN
+                    INSERT INTO tickets_fts (tickets_fts, rowid, title, description)
+                    VALUES ('delete', old.id, old.title, old.description);
+                END
+            """))
+            conn.execute(text("""
+                CREATE TRIGGER IF NOT EXISTS tickets_fts_au AFTER UPDATE OF title, description ON tickets BEGIN
+                    INSERT INTO tickets_fts (tickets_fts, rowid, title, description)
+                    VALUES ('delete', old.id, old.title, old.description);
+                    INSERT INTO tickets_fts (rowid, title, description)
+                    VALUES (new.id, new.title, new.description);
+                END
+            """))
+            if not exists:
+                # First run on an existing database: index the tickets already there
+                conn.execute(text("INSERT INTO tickets_fts (tickets_fts) VALUES ('rebuild')"))
+        return not exists
+
+    def rebuild(self):
+        if not self._create():
+            with self._engine.begin() as conn:
+                conn.execute(text("INSERT INTO tickets_fts (tickets_fts) VALUES ('rebuild')"))
+
+    def search(self, query, status=None, category=None, priority=None, limit=50):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        # Quote every word so user input can't be read as FTS5 syntax, and match prefixes
+        match = " ".join(f'"{term}"*' for term in terms)
+        sql = f"""
+            SELECT t.id, -bm25(tickets_fts, {TITLE_WEIGHT}, 1.0) AS score
+            FROM tickets_fts JOIN tickets t ON t.id = tickets_fts.rowid
+            WHERE tickets_fts MATCH :match
+        """
+        params = {"match": match, "limit": limit}
+        for column, value in (("status", status), ("category", category), ("priority", priority)):
+            if value:
+                sql += f" AND t.{column} = :{column}"
+                params[column] = value
+        sql += " ORDER BY score DESC LIMIT :limit"
+        with self._engine.connect() as conn:
+            return [(row[0], row[1]) for row in conn.execute(text(sql), params)]
+
+
+class InvertedIndex(TicketIndex):
+    """
+    BM25 over an in-memory postings map. Ticket metadata used for filtering is kept
+    alongside, so a search never touches the database.
+    """
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, session_factory, ticket_model, shared_state):
+        self._session_factory = session_factory
+        self._ticket_model = ticket_model
+        self._shared_state = shared_state
+        self._lock = threading.Lock()
+        self._postings = {}  # term -> {ticket_id: weighted term frequency}
+        self._vocab = []  # Sorted terms, for prefix lookups
+        self._vocab_dirty = False
+        self._docs = {}  # ticket_id -> (length, terms, status, category, priority)
+        self._total_length = 0.0
+        self._last_event = 0
+        self._built = False  # Loaded on first search (or warm_up), not in the constructor
+        self._build_lock = threading.Lock()
+
+    def _add(self, ticket):
+        tf = Counter()
+        for term in tokenize(ticket.title):
+            tf[term] += TITLE_WEIGHT
+        for term in tokenize(ticket.description):
+            tf[term] += 1.0
+        length = sum(tf.values())
+        for term, freq in tf.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                self._vocab_dirty = True
+            postings[ticket.id] = freq
+        self._docs[ticket.id] = (length, tuple(tf), ticket.status, ticket.category, ticket.priority)
+        self._total_length += length
+
+    def _remove(self, ticket_id):
+        doc = self._docs.pop(ticket_id, None)
+        if doc is None:
+            return
+        length, terms = doc[0], doc[1]
+        self._total_length -= length
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(ticket_id, None)
+                if not postings:
+                    del self._postings[term]
+                    self._vocab_dirty = True
+
+    def rebuild(self):
+        db = self._session_factory()
+        with self._lock:
+            self._last_event = self._shared_state.last_event_id(TICKET_CHANGES_CHANNEL)
+            self._postings, self._docs, self._total_length = {}, {}, 0.0
+            for ticket in db.query(self._ticket_model).yield_per(1000):
+                self._add(ticket)
+            self._vocab_dirty = True
+            self._built = True
+        db.close()
+
+    def warm_up(self):
+        if self._built:
+            return
+        with self._build_lock:
+            if not self._built:
+                self.rebuild()
+
+    def ticket_changed(self, ticket_id):
+        # Every worker (this one included) picks the change up from the channel
+        self._shared_state.publish(TICKET_CHANGES_CHANNEL, {"ticket_id": ticket_id})
+
+    def _catch_up(self):
+        if self._shared_state.missed_events(TICKET_CHANGES_CHANNEL, self._last_event):
+            # Some changes were trimmed from the channel before we read them
+            self.rebuild()
+            return
+        events, after = [], self._last_event
+        while True:
+            page = self._shared_state.read_since(TICKET_CHANGES_CHANNEL, after, limit=10000)
+            if not page:
+                break
+            events.extend(page)
+            after = page[-1][0]
+        if not events:
+            return
+        ids = {message["ticket_id"] for _, message in events}
+        db = self._session_factory()
+        model = self._ticket_model
+        tickets = {t.id: t for t in db.query(model).filter(model.id.in_(ids))}
+        with self._lock:
+            for ticket_id in ids:
+                self._remove(ticket_id)
+                if ticket_id in tickets:
+                    self._add(tickets[ticket_id])
+            self._last_event = events[-1][0]
+        db.close()
+
+    def _expand(self, term):
+        """All indexed terms starting with `term`."""
+        if self._vocab_dirty:
+            self._vocab = sorted(self._postings)
+            self._vocab_dirty = False
+        i = bisect_left(self._vocab, term)
+        matches = []
+        while i < len(self._vocab) and self._vocab[i].startswith(term):
+            matches.append(self._vocab[i])
+            i += 1
+        return matches
+
+    def search(self, query, status=None, category=None, priority=None, limit=50):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        self.warm_up()
+        self._catch_up()
+        with self._lock:
+            n = len(self._docs)
+            if not n:
+                return []
+            avg_length = self._total_length / n
+            scores = None
+            # Every query word must match (like FTS5's implicit AND)
+            for term in terms:
+                term_scores = {}
+                for indexed in self._expand(term):
+                    postings = self._postings[indexed]
+                    idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for ticket_id, freq in postings.items():
+                        length = self._docs[ticket_id][0]
+                        norm = freq + self.K1 * (1 - self.B + self.B * length / avg_length)
+                        term_scores[ticket_id] = term_scores.get(ticket_id, 0.0) + idf * freq * (self.K1 + 1) / norm
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {tid: s + term_scores[tid] for tid, s in scores.items() if tid in term_scores}
+                if not scores:
+                    return []
+
+            results = []
+            for ticket_id, score in scores.items():
+                _, _, t_status, t_category, t_priority = self._docs[ticket_id]
+                if (status and t_status != status) or (category and t_category != category) \
+                        or (priority and t_priority != priority):
+                    continue
+                results.append((ticket_id, score))
+        results.sort(key=lambda r: r[1], reverse=True)
+        return results[:limit]
+
+
+def create_ticket_index(engine, session_factory, ticket_model, shared_state) -> TicketIndex:
+    if engine.dialect.name == "sqlite":
+        return SqliteFtsIndex(engine)
+    return InvertedIndex(session_factory, ticket_model, shared_state)